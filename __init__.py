@@ -1,2 +1,3 @@
-__all__ = ["braindump", "gtd", "gtd_action_rows", "gui_datastores", \
-           "oproperty","singleton", "xmlstore"]
+__all__ = ["archive", "backend", "braindump", "gtd", "gtd_action_rows", "gui_datastores", \
+           "journalstore", "lru", "oproperty", "orderedset", "records", "singleton", "snapshot",
+           "sqlitestore", "wal", "watcher", "writebehind", "xmlstore", "xmlwriter"]
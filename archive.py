@@ -0,0 +1,101 @@
+#    Filename: archive.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: compressed, append-only archive of completed gtd objects
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-06:  Initial version by Darren Hart <darren@dvhart.com>
+
+import os, os.path
+import fnmatch
+import gzip
+import cPickle as pickle
+from logging import debug, info, warning, error, critical
+
+ARCHIVE_DIR = "archive"
+
+_SEGMENT_FORMAT = "segment-%06d.gz"
+_SEGMENT_PATTERN = "segment-*.gz"
+
+class Archive(object):
+    '''Records of objects moved out of the live store, kept in gzip compressed
+    segments.  Segments are only ever added, a crash can at worst lose the
+    one being written.'''
+
+    def __init__(self, path):
+        self.path = path
+
+    def __segments(self):
+        if not os.path.isdir(self.path):
+            return []
+        names = [name for name in os.listdir(self.path)
+                 if fnmatch.fnmatch(name, _SEGMENT_PATTERN)]
+        names.sort()
+        return names
+
+    def __append(self, entries, sync):
+        if not os.path.isdir(self.path):
+            os.mkdir(self.path)
+        segments = self.__segments()
+        number = 1
+        if segments:
+            number = int(segments[-1][len("segment-"):-len(".gz")]) + 1
+        filename = os.path.join(self.path, _SEGMENT_FORMAT % (number))
+        tmp = filename + ".tmp"
+        fd = open(tmp, "wb")
+        try:
+            gz = gzip.GzipFile(os.path.basename(filename), "wb", 9, fd)
+            pickle.dump(entries, gz, pickle.HIGHEST_PROTOCOL)
+            gz.close()
+            if sync:
+                fd.flush()
+                os.fsync(fd.fileno())
+        finally:
+            fd.close()
+        os.rename(tmp, filename)
+        debug("archived %d entries in %s" % (len(entries), filename))
+
+    def add(self, records, sync=True):
+        '''Archive records.'''
+        if records:
+            self.__append([("save", rec) for rec in records], sync)
+
+    def forget(self, ids, sync=True):
+        '''Remove the records of ids from the archive.'''
+        if ids and self.__segments():
+            self.__append([("delete", id) for id in ids], sync)
+
+    def records(self):
+        '''Read every segment, return a dict of id -> record.'''
+        records = {}
+        for name in self.__segments():
+            filename = os.path.join(self.path, name)
+            try:
+                gz = gzip.open(filename, "rb")
+                try:
+                    entries = pickle.load(gz)
+                finally:
+                    gz.close()
+            except:
+                error("skipping unreadable archive segment: %s" % (filename))
+                continue
+            for op, arg in entries:
+                if op == "save":
+                    records[arg["id"]] = arg
+                elif arg in records:
+                    del records[arg]
+        return records
@@ -0,0 +1,168 @@
+#    Filename: backend.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: the interface of the backing stores, an in-memory store, and
+#              selecting a store from the config
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-27:  Initial version by Darren Hart <darren@dvhart.com>
+
+from records import *
+from logging import debug, info, warning, error, critical
+
+# Backends, the store/backend config value
+BACKEND_XML = "xml"
+BACKEND_JOURNAL = "journal"
+BACKEND_SQLITE = "sqlite"
+BACKEND_MEMORY = "memory"
+
+_OBJECT_TYPES = ["context", "realm", "area", "project", "task"]
+
+class ChangeListener(object):
+    '''Call _changed(tree, op, obj) for each object saved or deleted in the
+    GTD() tree, except by _change_origin(), and _committed(tree) after each
+    transaction.'''
+
+    def connect(self, tree):
+        for type in _OBJECT_TYPES:
+            tree.connect(type + "_added", self.__on_change, "save")
+            tree.connect(type + "_modified", self.__on_change, "save")
+            tree.connect(type + "_removed", self.__on_change, "delete")
+        tree.connect("changes_committed", self.__on_committed)
+
+    def __on_change(self, tree, obj, op):
+        if not tree.commit_origin is self._change_origin():
+            self._changed(tree, op, obj)
+
+    def __on_committed(self, tree, changes):
+        self._committed(tree)
+
+    def _change_origin(self):
+        return self
+
+    def _changed(self, tree, op, obj):
+        raise NotImplementedError
+
+    def _committed(self, tree):
+        pass
+
+
+class Backend(ChangeListener):
+    '''Abstract Base Class for the backing stores, connect() saves every change
+    to the GTD() tree, a transaction as one batch.'''
+
+    def __init__(self):
+        self.__in_commit = False # batching a transaction commit
+
+    def load(self, path):
+        '''Load every object stored in path into the GTD() tree.'''
+        raise NotImplementedError
+
+    def save_object(self, obj):
+        raise NotImplementedError
+
+    def delete_object(self, obj):
+        raise NotImplementedError
+
+    def begin_batch(self):
+        '''Hold back the saves until commit_batch(), calls may be nested.'''
+        pass
+
+    def commit_batch(self):
+        pass
+
+    def flush(self):
+        '''Write anything the backend is holding back.'''
+        pass
+
+    def close(self):
+        self.flush()
+
+    def _changed(self, tree, op, obj):
+        if tree.committing and not self.__in_commit:
+            self.__in_commit = True
+            self.begin_batch()
+        if op == "save":
+            self.save_object(obj)
+        else:
+            self.delete_object(obj)
+
+    def _committed(self, tree):
+        if self.__in_commit:
+            self.__in_commit = False
+            self.commit_batch()
+
+
+class MemoryStore(Backend):
+    '''Keep the records of the saved objects in memory, for tests and
+    benchmarks.'''
+
+    def __init__(self, records=None):
+        Backend.__init__(self)
+        self.records = {} # id -> record
+        for rec in records or []:
+            self.records[rec["id"]] = rec
+        self.saves = 0
+        self.deletes = 0
+        self.batches = 0
+        self.__batch_depth = 0
+
+    def load(self, path=None):
+        builder = TreeBuilder()
+        builder.extend(self.records.values())
+        builder.build()
+
+    def save_object(self, obj):
+        self.records[obj.id] = object_record(obj)
+        self.saves = self.saves + 1
+
+    def delete_object(self, obj):
+        if obj.id in self.records:
+            del self.records[obj.id]
+        self.deletes = self.deletes + 1
+
+    def begin_batch(self):
+        self.__batch_depth = self.__batch_depth + 1
+
+    def commit_batch(self):
+        self.__batch_depth = self.__batch_depth - 1
+        if self.__batch_depth == 0:
+            self.batches = self.batches + 1
+
+
+def create_backend(store_config):
+    '''Return the backend named by store_config['backend'] (the store section
+    of Config, see set_defaults), created with the options it has there.'''
+    name = store_config.get('backend', BACKEND_XML)
+    if name == BACKEND_JOURNAL:
+        from journalstore import JournalStore
+        return JournalStore()
+    elif name == BACKEND_SQLITE:
+        from sqlitestore import SQLiteStore
+        return SQLiteStore()
+    elif name == BACKEND_MEMORY:
+        return MemoryStore()
+    elif name != BACKEND_XML:
+        warning("unknown backend: %s, using %s" % (name, BACKEND_XML))
+    import xmlstore
+    # one of DURABILITY_NONE, DURABILITY_BATCH, or DURABILITY_WRITE, and
+    # LAYOUT_FLAT or LAYOUT_SHARDED (a flat directory is sharded in place)
+    return xmlstore.XMLStore(store_config.get('durability', xmlstore.DURABILITY_BATCH),
+                             store_config.get('layout', xmlstore.LAYOUT_FLAT),
+                             str(store_config.get('lazy_notes', True)) == "True",
+                             store_config.get('dates', xmlstore.DATES_TEXT),
+                             int(store_config.get('jobs', 0)))
@@ -0,0 +1,84 @@
+#    Filename: bench_backends.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: run the same workload against every backing store
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-27:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+from backend import *
+
+BACKENDS = [BACKEND_MEMORY, BACKEND_XML, BACKEND_JOURNAL, BACKEND_SQLITE]
+
+def all_tasks():
+    tasks = gtd.RealmNone().get_tasks()
+    for r in GTD().realms:
+        tasks.extend(r.get_tasks())
+    return tasks
+
+def edit_tasks(count):
+    tasks = all_tasks()
+    for i in range(count):
+        t = tasks[i % len(tasks)]
+        t.title = t.title + "."
+
+def edit_transaction(count):
+    tasks = all_tasks()
+    GTD().begin_transaction()
+    try:
+        for i in range(count):
+            t = tasks[i % len(tasks)]
+            t.title = t.title + "."
+    finally:
+        GTD().commit_transaction()
+
+def delete_tasks(count):
+    for t in all_tasks()[:count]:
+        GTD().remove_task(t)
+
+def bench(name, tasks, edits):
+    path = temp_dir()
+    try:
+        try:
+            store = create_backend({"backend":name})
+        except ImportError, e:
+            print "%s: unavailable, %s" % (name, e)
+            return
+        reset_tree()
+        store.load(path)
+        store.connect(GTD())
+        report("%s: populate" % (name), timed(populate, tasks), tasks)
+        report("%s: edit" % (name), timed(edit_tasks, edits), edits)
+        report("%s: edit, one transaction" % (name), timed(edit_transaction, edits), edits)
+        report("%s: delete" % (name), timed(delete_tasks, edits), edits)
+        report("%s: close" % (name), timed(store.close))
+
+        reset_tree()
+        if name != BACKEND_MEMORY:
+            store = create_backend({"backend":name})
+        report("%s: load" % (name), timed(store.load, path))
+        store.close()
+    finally:
+        remove_dir(path)
+
+if __name__ == "__main__":
+    tasks = 5000
+    edits = 1000
+    print "%d tasks, %d edits" % (tasks, edits)
+    for name in BACKENDS:
+        bench(name, tasks, edits)
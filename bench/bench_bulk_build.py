@@ -0,0 +1,40 @@
+#    Filename: bench_bulk_build.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: show tree building during load scales linearly with tasks
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Apr-25:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+from records import TreeBuilder
+
+def build(recs):
+    builder = TreeBuilder()
+    builder.extend(recs)
+    builder.build()
+
+if __name__ == "__main__":
+    # Half the tasks have no project, which used to cost O(N^2) when each
+    # was created under ProjectNone and then moved
+    for tasks in [1000, 10000, 100000]:
+        recs = synthetic_records(tasks, tasks_per_project=2)
+        for rec in recs:
+            if rec["type"] == "task" and rec["title"].endswith(("1", "3", "5", "7", "9")):
+                rec["project"] = None
+        reset_tree()
+        report("bulk build, %d tasks" % (tasks), timed(build, recs), tasks)
@@ -0,0 +1,67 @@
+#    Filename: bench_children.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: moving tasks between projects, children in lists and OrderedSets
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-27:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+from orderedset import OrderedSet
+
+def move_task(task, project):
+    '''Move task to project as the Details form does.'''
+    task.project.remove_task(task)
+    project.add_task(task)
+    task.project = project
+
+def move_tasks(tasks, project):
+    for t in tasks:
+        move_task(t, project)
+
+def build(size, container):
+    '''Return two projects, the first holding size tasks, with their tasks
+    kept in container()s.'''
+    reset_tree()
+    area = gtd.Area.create(None, "area", gtd.Realm.create(None, "realm", True))
+    projects = []
+    for title in ["from", "to"]:
+        p = gtd.Project.create(None, title, "", area)
+        p.tasks = container()
+        projects.append(p)
+    GTD().begin_build()
+    for i in range(size):
+        gtd.Task.create(None, "task %d" % (i), projects[0])
+    GTD().end_build()
+    return projects
+
+if __name__ == "__main__":
+    # Tasks are moved from the end of the source project, the worst case for
+    # list.remove(), which compares each task with Base.__cmp__.  The lists
+    # move fewer tasks to keep the run short, the times are per move.
+    for name, container, moves, sizes in [("list", list, 100, [2000, 10000]),
+                                           ("OrderedSet", OrderedSet, 10000,
+                                            [10000, 50000, 200000])]:
+        for size in sizes:
+            src, dst = build(size, container)
+            tasks = list(src.tasks)[-moves:]
+            tasks.reverse()
+            seconds = timed(move_tasks, tasks, dst)
+            seconds = seconds + timed(move_tasks, tasks, src)
+            assert len(src.tasks) == size and len(dst.tasks) == 0
+            report("%s: %d tasks, %d moves" % (name, size, 2 * len(tasks)),
+                   seconds, 2 * len(tasks))
@@ -0,0 +1,73 @@
+#    Filename: bench_context_index.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: context queries and deletion with the context -> tasks index
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-27:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+from backend import MemoryStore
+
+# The walk GTD.context_tasks() used to make, kept as the reference the index
+# must agree with.
+def walk_context_tasks(context):
+    tasks = []
+    for r in GTD().realms:
+        if r.visible:
+            for t in r.get_tasks():
+                if context in t.contexts:
+                    tasks.append(t)
+    return tasks
+
+def query_all(func, contexts):
+    for c in contexts:
+        func(c)
+
+def check(contexts):
+    for c in contexts:
+        if set(GTD().context_tasks(c)) != set(walk_context_tasks(c)):
+            print "MISMATCH for context %s" % (c.title)
+            sys.exit(1)
+
+def real_contexts():
+    return [c for c in GTD().contexts if not isinstance(c, gtd.BaseNone)]
+
+if __name__ == "__main__":
+    for tasks in [10000, 50000]:
+        reset_tree()
+        store = MemoryStore()
+        store.connect(GTD())
+        populate(tasks, contexts=100)
+        # move some tasks between contexts and hide a realm
+        contexts = real_contexts()
+        for t in GTD().realms[1].get_tasks()[:500]:
+            t.add_context(contexts[0])
+            t.remove_context(contexts[1])
+        GTD().realms[2].visible = False
+        check(contexts)
+        # and the index must be rebuilt the same by a load
+        reset_tree()
+        store.load()
+        contexts = real_contexts()
+        check(contexts)
+        print "%d tasks in %d contexts, queries agree" % (tasks, len(contexts))
+        report("walk, every context", timed(query_all, walk_context_tasks, contexts),
+               len(contexts))
+        report("index, every context", timed(query_all, GTD().context_tasks, contexts),
+               len(contexts))
+        report("remove_context", timed(GTD().remove_context, contexts[0]))
@@ -0,0 +1,47 @@
+#    Filename: bench_dates.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: compare strptime with the date parser of xmlstore
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-20:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+import calendar
+from xmlstore import parse_date, _DATE_FORMAT
+
+def strptime_all(strings):
+    for s in strings:
+        datetime.strptime(s, _DATE_FORMAT)
+
+def parse_all(strings):
+    for s in strings:
+        parse_date(s)
+
+if __name__ == "__main__":
+    # the dates of 100k tasks spread over a year
+    now = datetime.now().replace(microsecond=0)
+    dates = [now - timedelta(days=i % 365, seconds=i) for i in range(100000)]
+    text = [d.strftime(_DATE_FORMAT) for d in dates]
+    epoch = ["%d" % (calendar.timegm(d.timetuple())) for d in dates]
+    for strings in [text, epoch]:
+        if [parse_date(s) for s in strings] != dates:
+            print "MISMATCH"
+            sys.exit(1)
+    report("strptime", timed(strptime_all, text), len(text))
+    report("parse_date, text", timed(parse_all, text), len(text))
+    report("parse_date, epoch", timed(parse_all, epoch), len(epoch))
@@ -0,0 +1,126 @@
+#    Filename: bench_expat_load.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: compare parsing the object files with expat and with xml.sax
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-20:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+from cStringIO import StringIO
+from xml.sax import make_parser, handler
+from xmlstore import XMLStore, GTDRecordParser, _DATE_FORMAT
+
+# The xml.sax handler xmlstore used before GTDRecordParser, kept as the
+# reference the new one must agree with.
+class SAXRecordHandler(handler.ContentHandler):
+    def __init__(self):
+        self.record = None
+        self.__chars = []
+
+    def startElement(self, name, attrs):
+        self.__chars = []
+        id_str = attrs.get("id", None)
+        if name in ["task", "project", "area", "realm", "context"]:
+            self.record = {"type":name, "id":uuid.UUID(id_str), "title":""}
+            if name in ["task", "project"]:
+                self.record.update({"notes":"", "start_date":None, "due_date":None,
+                                    "complete":None})
+                if name == "task":
+                    self.record.update({"project":None, "contexts":[]})
+                else:
+                    self.record["area"] = None
+            elif name == "area":
+                self.record["realm"] = None
+        elif name == "context_ref":
+            self.record["contexts"].append(uuid.UUID(id_str))
+        elif name == "project_ref":
+            self.record["project"] = uuid.UUID(id_str)
+        elif name == "area_ref":
+            self.record["area"] = uuid.UUID(id_str)
+        elif name == "realm_ref":
+            self.record["realm"] = uuid.UUID(id_str)
+
+    def endElement(self, name):
+        chars = ' '.join(''.join(self.__chars).split())
+        self.__chars = []
+        if name in ["realm", "context", "title"]:
+            self.record["title"] = chars
+        elif name == "notes":
+            self.record["notes"] = chars
+        elif name in ["start_date", "due_date", "complete"]:
+            if chars:
+                self.record[name] = datetime.strptime(chars, _DATE_FORMAT)
+
+    def characters(self, content):
+        if self.record:
+            self.__chars.append(content)
+
+def read_files(path):
+    data = []
+    for name in os.listdir(path):
+        if name.endswith(".xml"):
+            fd = open(os.path.join(path, name), "rb")
+            data.append(fd.read())
+            fd.close()
+    return data
+
+def parse_sax(data):
+    ch = SAXRecordHandler()
+    parser = make_parser()
+    parser.setFeature(handler.feature_namespaces, 0)
+    parser.setContentHandler(ch)
+    recs = []
+    for d in data:
+        ch.record = None
+        parser.parse(StringIO(d))
+        recs.append(ch.record)
+    return recs
+
+def parse_expat(data):
+    parser = GTDRecordParser()
+    return [parser.parse(d) for d in data]
+
+if __name__ == "__main__":
+    path = temp_dir()
+    try:
+        store = XMLStore()
+        store.load(path)
+        store.connect(GTD())
+        store.begin_batch()
+        populate(47500)
+        # text the parsers must agree on
+        c = gtd.Context.create(None, u"caf\xe9 &amp; <\u2603>")
+        gtd.Task.create(None, u"  split   over\n lines ", gtd.ProjectNone(), [c],
+                        "notes & " * 2000)
+        store.commit_batch()
+
+        data = read_files(path)
+        print "%d objects" % (len(data))
+        results = {}
+        for name, func in [("xml.sax", parse_sax), ("expat", parse_expat)]:
+            start = time.time()
+            results[name] = func(data)
+            report(name, time.time() - start, len(data))
+        if results["xml.sax"] != results["expat"]:
+            print "MISMATCH between the xml.sax and expat records"
+            sys.exit(1)
+        print "records are identical"
+        reset_tree()
+        report("XMLStore.load", timed(XMLStore().load, path), len(data))
+    finally:
+        remove_dir(path)
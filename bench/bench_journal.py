@@ -0,0 +1,68 @@
+#    Filename: bench_journal.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: compare load time and per-edit write cost of XMLStore and
+#              JournalStore
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Apr-04:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+from xmlstore import XMLStore
+from journalstore import JournalStore, migrate_xml
+
+def edit_tasks(count):
+    tasks = gtd.RealmNone().get_tasks()
+    for r in GTD().realms:
+        tasks.extend(r.get_tasks())
+    for i in range(count):
+        t = tasks[i % len(tasks)]
+        t.title = t.title + "."
+
+def bench(tasks, edits):
+    print "%d tasks, %d edits" % (tasks, edits)
+    path = temp_dir()
+    try:
+        reset_tree()
+        store = XMLStore()
+        store.load(path)
+        store.connect(GTD())
+        report("xml: populate", timed(populate, tasks))
+
+        reset_tree()
+        report("xml: load", timed(XMLStore().load, path))
+        reset_tree()
+        report("journal: migrate", timed(migrate_xml, path))
+
+        reset_tree()
+        store = XMLStore()
+        store.load(path)
+        store.connect(GTD())
+        report("xml: edit", timed(edit_tasks, edits), edits)
+
+        reset_tree()
+        store = JournalStore()
+        report("journal: load", timed(store.load, path))
+        store.connect(GTD())
+        report("journal: edit", timed(edit_tasks, edits), edits)
+        store.close()
+    finally:
+        remove_dir(path)
+
+if __name__ == "__main__":
+    for tasks in [1000, 10000]:
+        bench(tasks, 1000)
@@ -0,0 +1,47 @@
+#    Filename: bench_lazy_notes.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: compare loading with and without lazy notes
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-13:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+from xmlstore import XMLStore
+
+NOTES = "a long note pasted from an email " * 100
+
+def resident_notes():
+    return sum([len(t.loaded_notes or "") for r in GTD().realms for t in r.get_tasks()])
+
+if __name__ == "__main__":
+    path = temp_dir()
+    try:
+        store = XMLStore()
+        store.load(path)
+        store.connect(GTD())
+        populate(5000)
+        for r in GTD().realms:
+            for t in r.get_tasks():
+                t.notes = NOTES
+        for lazy in [False, True]:
+            reset_tree()
+            store = XMLStore(lazy_notes=lazy)
+            report("load, lazy_notes=%s" % (lazy), timed(store.load, path), 5000)
+            print "%-40s %10d chars" % ("  notes in memory", resident_notes())
+    finally:
+        remove_dir(path)
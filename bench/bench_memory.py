@@ -0,0 +1,70 @@
+#    Filename: bench_memory.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: the memory taken by each task in the GTD() tree
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-27:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+import gc
+import resource
+import subprocess
+
+def max_rss():
+    '''Return the peak resident size of this process in bytes.'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def build(tasks, tasks_per_project=20, contexts=100):
+    '''Build a tree of tasks with a start date, one context, and loaded notes
+    (the tree populate builds, without the signals).'''
+    now = datetime.now()
+    ctxs = [gtd.Context.create(None, "context %d" % (i)) for i in range(contexts)]
+    area = gtd.Area.create(None, "area", gtd.Realm.create(None, "realm", True))
+    GTD().begin_build()
+    for i in range(tasks):
+        if i % tasks_per_project == 0:
+            project = gtd.Project.create(None, "project %d" % (i / tasks_per_project),
+                                         "", area)
+        task = gtd.Task.create(None, "task %d" % (i), project, [ctxs[i % contexts]],
+                               "notes %d" % (i))
+        task.start_date = now - timedelta(days=i % 30)
+    GTD().end_build()
+
+def measure(tasks, compact):
+    '''Build the tree in this process and print the bytes it took per task.'''
+    if compact:
+        gtd.Base.compact_ids = True
+    gc.collect()
+    before = max_rss()
+    build(tasks)
+    gc.collect()
+    print "%d %d" % (tasks, (max_rss() - before) / tasks)
+
+if __name__ == "__main__":
+    # Each tree is built in a process of its own, its peak size only grows
+    if len(sys.argv) == 4 and sys.argv[1] == "--measure":
+        measure(int(sys.argv[2]), sys.argv[3] == "compact")
+        sys.exit(0)
+    for tasks in [10000, 100000, 1000000]:
+        for ids in ["uuid", "compact"]:
+            if ids == "compact" and not hasattr(gtd.Base, "compact_ids"):
+                continue
+            out = subprocess.Popen([sys.executable, __file__, "--measure", str(tasks), ids],
+                                   stdout=subprocess.PIPE).communicate()[0]
+            print "%-40s %10s bytes/task" % ("%d tasks, %s ids" % (tasks, ids),
+                                             out.split()[-1])
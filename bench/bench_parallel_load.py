@@ -0,0 +1,48 @@
+#    Filename: bench_parallel_load.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: XMLStore cold load time by number of parser processes
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Apr-18:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+import multiprocessing
+from xmlstore import XMLStore
+
+def bench(tasks):
+    print "%d tasks" % (tasks)
+    path = temp_dir()
+    try:
+        reset_tree()
+        store = XMLStore()
+        store.load(path)
+        store.connect(GTD())
+        populate(tasks)
+
+        # the single pass loader this replaced is gone, one process is the
+        # baseline
+        jobs = 1
+        while jobs <= multiprocessing.cpu_count():
+            reset_tree()
+            report("two phase, %d processes" % (jobs), timed(XMLStore().load, path, jobs))
+            jobs = jobs * 2
+    finally:
+        remove_dir(path)
+
+if __name__ == "__main__":
+    bench(20000)
@@ -0,0 +1,119 @@
+#    Filename: bench_serializer.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: compare the template serializer with saxutils.XMLGenerator
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-20:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+from cStringIO import StringIO
+from collections import OrderedDict
+from xml.sax import saxutils
+from xmlwriter import object_xml, FORMAT_VERSION
+
+_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# The XMLGenerator serializer xmlstore used before xmlwriter (updated for
+# the current format), kept as the reference the new one must match byte for
+# byte.
+
+def _simple_element(x, name, attrs, chars=None):
+    x.startElement(name, attrs)
+    if (chars):
+        x.characters(chars)
+    x.endElement(name)
+    x.characters("\n")
+
+def _date_str(d):
+    if d:
+        return d.strftime(_DATE_FORMAT)
+    return ""
+
+def generator_xml(obj):
+    type = obj.__class__.__name__.lower()
+    buf = StringIO()
+    x = saxutils.XMLGenerator(buf)
+    x.startDocument()
+    root = OrderedDict([("id", str(obj.id)), ("version", str(FORMAT_VERSION))])
+    if type in ["context", "realm"]:
+        _simple_element(x, type, root, obj.title)
+        x.endDocument()
+        return buf.getvalue()
+    x.startElement(type, root)
+    x.characters("\n")
+    _simple_element(x, "title", {}, obj.title)
+    if type == "area":
+        if not isinstance(obj.realm, gtd.RealmNone):
+            _simple_element(x, "realm_ref", {"id":str(obj.realm.id)})
+    else:
+        _simple_element(x, "notes", {}, obj.notes)
+        _simple_element(x, "start_date", {}, _date_str(obj.start_date))
+        _simple_element(x, "due_date", {}, _date_str(obj.due_date))
+        if type == "project":
+            if not isinstance(obj.area, gtd.AreaNone):
+                _simple_element(x, "area_ref", {"id":str(obj.area.id)})
+        else:
+            if not isinstance(obj.project, gtd.ProjectNone):
+                _simple_element(x, "project_ref", {"id":str(obj.project.id)})
+            for c in obj.contexts:
+                _simple_element(x, "context_ref", {"id":str(c.id)})
+        _simple_element(x, "complete", {}, _date_str(obj.complete))
+    x.endElement(type)
+    x.endDocument()
+    return buf.getvalue()
+
+def tree_objects_list():
+    objs = []
+    for c in GTD().contexts:
+        if not isinstance(c, gtd.BaseNone):
+            objs.append(c)
+    for r in GTD().realms:
+        if not isinstance(r, gtd.BaseNone):
+            objs.append(r)
+        for a in r.areas:
+            if not isinstance(a, gtd.BaseNone):
+                objs.append(a)
+            for p in a.projects:
+                if not isinstance(p, gtd.BaseNone):
+                    objs.append(p)
+                objs.extend(p.tasks)
+    return objs
+
+def serialize_all(func, objs):
+    for obj in objs:
+        func(obj)
+
+if __name__ == "__main__":
+    populate(10000)
+    # titles and notes that need escaping or character references
+    odd = gtd.Context.create(None, u"caf\xe9 & <bar> \"quoted\" \u20ac")
+    task = gtd.Task.create(None, u"r\xe9sum\xe9 > \u2603", gtd.ProjectNone(), [odd],
+                           "a\tb\r\nc & 'd'")
+    gtd.Area.create(None, "<no realm>", gtd.RealmNone())
+    objs = tree_objects_list()
+    for obj in objs:
+        if object_xml(obj) != generator_xml(obj):
+            print "MISMATCH for %s %s" % (obj.__class__.__name__, obj.id)
+            print repr(generator_xml(obj))
+            print repr(object_xml(obj))
+            sys.exit(1)
+    print "%d objects serialized identically" % (len(objs))
+    for name, func in [("XMLGenerator", generator_xml), ("xmlwriter", object_xml)]:
+        seconds = timed(serialize_all, func, objs)
+        report(name, seconds, len(objs))
+        print "%-40s %10.0f saves/s" % ("", len(objs) / seconds)
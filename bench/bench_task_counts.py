@@ -0,0 +1,137 @@
+#    Filename: bench_task_counts.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: task counts kept by the containers against counting get_tasks()
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-27:  Initial version by Darren Hart <darren@dvhart.com>
+
+from common import *
+from backend import MemoryStore
+from gtd import Actionable
+
+def container_tasks(container):
+    if isinstance(container, (gtd.Project, gtd.ProjectNone)):
+        return list(container.tasks)
+    return container.get_tasks()
+
+def recount(container):
+    '''Return the TaskCounts of container, counted from its tasks.'''
+    counts = gtd.TaskCounts()
+    for t in container_tasks(container):
+        counts.add(t.state, t.complete_week, 1)
+    return counts
+
+def containers():
+    found = []
+    for r in GTD().realms:
+        found.append(r)
+        for a in r.areas:
+            found.append(a)
+            found.extend(a.projects)
+    return found
+
+def check(step):
+    for c in containers():
+        if sorted(c.task_counts.items()) != sorted(recount(c).items()):
+            print "MISMATCH after %s for %s %s" % (step, c.__class__.__name__, c.title)
+            sys.exit(1)
+
+def review_counts():
+    '''The weekly review numbers of every realm, area and project.'''
+    today = datetime.now()
+    for c in containers():
+        counts = c.task_counts
+        counts.open(), counts.count(Actionable.OVERDUE), counts.completed_in_week(today)
+
+def review_get_tasks():
+    today = datetime.now().isocalendar()[:2]
+    for c in containers():
+        open = overdue = completed = 0
+        for t in container_tasks(c):
+            if t.state != Actionable.COMPLETE:
+                open = open + 1
+            if t.state == Actionable.OVERDUE:
+                overdue = overdue + 1
+            if t.complete_week == today:
+                completed = completed + 1
+
+def complete_tasks(tasks):
+    for t in tasks:
+        t.complete = True
+
+def move_task(task, project):
+    task.project.remove_task(task)
+    project.add_task(task)
+    task.project = project
+
+def edit_tree():
+    '''Complete, redate, move, and remove tasks, projects, and areas,
+    checking the counts after each kind of change.'''
+    now = datetime.now()
+    realms = [r for r in GTD().realms if not isinstance(r, gtd.BaseNone)]
+    areas = [a for r in realms for a in r.areas]
+    projects = [p for a in areas for p in a.projects]
+    tasks = [t for p in projects for t in p.tasks]
+    for t in tasks[:300]:
+        t.complete = not t.complete
+    tasks[300].complete = now - timedelta(days=7)
+    check("completion")
+    for i, t in enumerate(tasks[300:600]):
+        t.due_date = now - timedelta(days=i % 3)
+        t.start_date = None
+    check("date changes")
+    for i, t in enumerate(tasks[600:900]):
+        move_task(t, projects[-1 - i % 5])
+    move_task(tasks[900], gtd.ProjectNone())
+    check("moving tasks")
+    for p in projects[:10]:
+        p.area.remove_project(p)
+        areas[-1].add_project(p)
+        p.area = areas[-1]
+    a = areas[0]
+    a.realm.remove_area(a)
+    realms[-1].add_area(a)
+    a.realm = realms[-1]
+    check("moving projects and areas")
+    for t in tasks[1000:1100]:
+        GTD().remove_task(t)
+    tasks[1000].complete = now
+    check("removing tasks")
+    GTD().remove_project(projects[20])
+    GTD().remove_project(projects[21], True)
+    GTD().remove_area(areas[3])
+    GTD().remove_realm(realms[1])
+    check("removing projects, areas, and a realm")
+
+if __name__ == "__main__":
+    for tasks in [10000, 50000]:
+        reset_tree()
+        store = MemoryStore()
+        store.connect(GTD())
+        populate(tasks)
+        check("populate")
+        edit_tree()
+        reset_tree()
+        store.load()
+        check("load")
+        print "%d tasks, counts agree" % (tasks)
+        n = len(containers())
+        report("review from get_tasks()", timed(review_get_tasks), n)
+        report("review from task_counts", timed(review_counts), n)
+        some = [t for t in GTD().realms[1].get_tasks() if not t.complete][:1000]
+        report("complete, with the counts updated", timed(complete_tasks, some), len(some))
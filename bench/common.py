@@ -0,0 +1,124 @@
+#    Filename: common.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: shared helpers for the storage benchmarks
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Apr-04:  Initial version by Darren Hart <darren@dvhart.com>
+
+# The benchmarks are run from the source tree: python bench/<name>.py
+import sys, os.path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import time
+import uuid
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import gtd
+from gtd import GTD
+
+def reset_tree():
+    '''Drop every object (and signal handler) from the GTD() tree.'''
+    gtd.RealmNone().areas.clear()
+    gtd.RealmNone().areas.append(gtd.AreaNone())
+    gtd.AreaNone().projects.clear()
+    gtd.AreaNone().projects.append(gtd.ProjectNone())
+    gtd.ProjectNone().tasks.clear()
+    for none in [gtd.RealmNone(), gtd.AreaNone(), gtd.ProjectNone()]:
+        none.task_counts = gtd.TaskCounts()
+    gtd.GTD.instance = None
+    GTD()
+
+def populate(tasks, tasks_per_project=20, projects_per_area=10, areas_per_realm=5,
+             contexts=10):
+    '''Build a synthetic tree with the given number of tasks in GTD().'''
+    now = datetime.now()
+    ctxs = [gtd.Context.create(None, "context %d" % (i)) for i in range(contexts)]
+    realm = area = project = None
+    for i in range(tasks):
+        if i % tasks_per_project == 0:
+            p = i / tasks_per_project
+            if p % projects_per_area == 0:
+                a = p / projects_per_area
+                if a % areas_per_realm == 0:
+                    realm = gtd.Realm.create(None, "realm %d" % (a / areas_per_realm), True)
+                area = gtd.Area.create(None, "area %d" % (a), realm)
+            project = gtd.Project.create(None, "project %d" % (p), "project notes", area)
+            project.start_date = now
+        task = gtd.Task.create(None, "task %d" % (i), project, [ctxs[i % contexts]],
+                               "some notes for task %d" % (i))
+        task.start_date = now - timedelta(days=i % 30)
+        if i % 3 == 0:
+            task.due_date = now + timedelta(days=i % 14)
+        if i % 5 == 0:
+            task.complete = now
+
+def synthetic_records(tasks, tasks_per_project=20, projects_per_area=10,
+                      areas_per_realm=5, contexts=10):
+    '''Return records (see records.py) for a tree like the one populate builds.'''
+    now = datetime.now()
+    recs = []
+    ctxs = []
+    for i in range(contexts):
+        ctxs.append(uuid.uuid4())
+        recs.append({"type":"context", "id":ctxs[-1], "title":"context %d" % (i)})
+    realm = area = project = None
+    for i in range(tasks):
+        if i % tasks_per_project == 0:
+            p = i / tasks_per_project
+            if p % projects_per_area == 0:
+                a = p / projects_per_area
+                if a % areas_per_realm == 0:
+                    realm = uuid.uuid4()
+                    recs.append({"type":"realm", "id":realm,
+                                 "title":"realm %d" % (a / areas_per_realm)})
+                area = uuid.uuid4()
+                recs.append({"type":"area", "id":area, "title":"area %d" % (a),
+                             "realm":realm})
+            project = uuid.uuid4()
+            recs.append({"type":"project", "id":project, "title":"project %d" % (p),
+                         "notes":"project notes", "start_date":now, "due_date":None,
+                         "complete":None, "area":area})
+        rec = {"type":"task", "id":uuid.uuid4(), "title":"task %d" % (i),
+               "notes":"some notes for task %d" % (i),
+               "start_date":now - timedelta(days=i % 30), "due_date":None,
+               "complete":None, "project":project, "contexts":[ctxs[i % contexts]]}
+        if i % 3 == 0:
+            rec["due_date"] = now + timedelta(days=i % 14)
+        if i % 5 == 0:
+            rec["complete"] = now
+        recs.append(rec)
+    return recs
+
+def temp_dir():
+    return tempfile.mkdtemp(prefix="braindump-bench-")
+
+def remove_dir(path):
+    shutil.rmtree(path, True)
+
+def timed(func, *args):
+    '''Return the wall clock seconds taken by func(*args).'''
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+def report(name, seconds, count=None):
+    if count:
+        print "%-40s %10.3f s %12.1f us/op" % (name, seconds, seconds * 1000000.0 / count)
+    else:
+        print "%-40s %10.3f s" % (name, seconds)
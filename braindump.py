@@ -27,6 +27,7 @@ import datetime
 import logging
 from logging import debug, info, warning, error, critical
 
+import gobject
 import gtk, gtk.glade
 import gnome, gnome.ui
 import sys
@@ -44,8 +45,12 @@ from gui_datastores import *
 from filters import *
 
 # FIXME: make this in a package, and import each module in a package
-# (ie support multiple backing stores)
-from xmlstore import *
+from backend import create_backend
+from writebehind import WriteBehind
+from watcher import DirectoryWatcher
+
+# Seconds between snapshots of the tree (see XMLStore.write_snapshot)
+SNAPSHOT_INTERVAL = 300
 
 class GTDSignalTest:
     def __init__(self):
@@ -65,6 +70,8 @@ class GTDSignalTest:
         GTD().connect("context_modified", self.on_context_modified)
         GTD().connect("context_added", self.on_context_added)
         GTD().connect("context_removed", self.on_context_removed)
+        GTD().connect("tree_built", self.on_tree_built)
+        GTD().connect("changes_committed", self.on_changes_committed)
 
     def on_realm_visible_changed(self, tree, realm):
         debug('on_realm_visible_changed: %s.visible = %s' % (realm.title, realm.visible))
@@ -98,6 +105,10 @@ class GTDSignalTest:
         debug('context_added: %s' % (context.title))
     def on_context_removed(self, tree, context):
         debug('context_removed: %s' % (context.title))
+    def on_tree_built(self, tree, objects):
+        debug('tree_built: %d objects' % (len(objects)))
+    def on_changes_committed(self, tree, changes):
+        debug('changes_committed: %d changes' % (len(changes)))
 
 
 # GUI Classses and callbacks
@@ -118,9 +129,30 @@ class BrainDump(object):
 
         # Initialize the GTD Tree and load the user data
         GTD(None)
-        self.backing_store = XMLStore()
+        # the backend and its options are in the store section of the config
+        store_config = self.config.get('store', {})
+        gtd.Base.compact_ids = str(store_config.get('compact_ids', False)) == "True"
+        self.backing_store = create_backend(store_config)
         self.backing_store.load(self.config.braindump_dir)
-        self.backing_store.connect(GTD())
+        # Move items completed more than archive_days ago to the archive,
+        # they are only paged back in to show completed items.  Off (0)
+        # unless enabled in the store section of the config.
+        archive_days = int(store_config.get('archive_days', 0))
+        if archive_days and hasattr(self.backing_store, "archive"):
+            self.backing_store.archive(archive_days)
+        self.archive_loaded = False
+        # Saves are written from a worker thread so a slow disk doesn't stall
+        # the GUI, the queue must be closed before we exit
+        self.save_queue = WriteBehind(self.backing_store)
+        self.save_queue.connect(GTD())
+        gobject.timeout_add(SNAPSHOT_INTERVAL * 1000, self.__write_snapshot)
+        # Merge in changes made by other processes (or sync tools)
+        self.watcher = None
+        if str(self.config.get('sync', {}).get('watch_data_dir', True)) == "True" and \
+           hasattr(self.backing_store, "refresh"):
+            self.watcher = DirectoryWatcher(self.backing_store, self.config.braindump_dir,
+                                            self.save_queue)
+            self.watcher.start()
 
         ##### Build Data Stores #####
         # Instantiate the various GUI datastores and filters from the GTD() singleton tree
@@ -175,6 +207,7 @@ class BrainDump(object):
         GTD().connect("realm_modified", self.realm_store.on_gtd_modified)
         GTD().connect("realm_added", self.realm_store.on_gtd_added)
         GTD().connect("realm_removed", self.realm_store.on_gtd_removed)
+        GTD().connect("changes_committed", self.realm_store.on_gtd_committed)
 
         GTD().connect("realm_modified", self.realm_area_store.on_realm_modified)
         GTD().connect("realm_added", self.realm_area_store.on_realm_added)
@@ -188,22 +221,27 @@ class BrainDump(object):
         GTD().connect("area_modified", self.area_store.on_gtd_modified)
         GTD().connect("area_added", self.area_store.on_gtd_added)
         GTD().connect("area_removed", self.area_store.on_gtd_removed)
+        GTD().connect("changes_committed", self.area_store.on_gtd_committed)
 
         GTD().connect("project_modified", self.project_store.on_gtd_modified)
         GTD().connect("project_added", self.project_store.on_gtd_added)
         GTD().connect("project_removed", self.project_store.on_gtd_removed)
+        GTD().connect("changes_committed", self.project_store.on_gtd_committed)
 
         GTD().connect("project_modified", self.project_store_date.on_gtd_modified)
         GTD().connect("project_added", self.project_store_date.on_gtd_added)
         GTD().connect("project_removed", self.project_store_date.on_gtd_removed)
+        GTD().connect("changes_committed", self.project_store_date.on_gtd_committed)
 
         GTD().connect("task_modified", self.task_store.on_gtd_modified)
         GTD().connect("task_added", self.task_store.on_gtd_added)
         GTD().connect("task_removed", self.task_store.on_gtd_removed)
+        GTD().connect("changes_committed", self.task_store.on_gtd_committed)
 
         GTD().connect("context_modified", self.context_store.on_gtd_modified)
         GTD().connect("context_added", self.context_store.on_gtd_added)
         GTD().connect("context_removed", self.context_store.on_gtd_removed)
+        GTD().connect("changes_committed", self.context_store.on_gtd_committed)
 
 
         ##### Build the GUI #####
@@ -303,14 +341,40 @@ class BrainDump(object):
         # Ensure the callback is called, regardless of glade's initial state
         self.on_show_completed_toggled(GUI().get_widget("show_completed").widget)
 
+    def __write_snapshot(self):
+        # The snapshot must match the files on disk, skip it if saves are pending
+        if self.save_queue.depth() == 0 and hasattr(self.backing_store, "write_snapshot"):
+            self.save_queue.flush()
+            self.backing_store.write_snapshot()
+        return True
+
+    def __shutdown(self):
+        if self.watcher:
+            self.watcher.stop()
+        stats = self.save_queue.stats()
+        self.save_queue.close()
+        self.backing_store.close()
+        info("save queue: %d written in %d flushes, %d coalesced, max depth %d, "
+             "avg flush %.3f s, max flush %.3f s" %
+             (stats["written"], stats["flushes"], stats["coalesced"], stats["max_depth"],
+              stats["avg_flush_latency"], stats["max_flush_latency"]))
+        if hasattr(self.backing_store, "stats"):
+            stats = self.backing_store.stats()
+            info("backing store: %d files written, %d unchanged saves skipped" %
+                 (stats["writes"], stats["skipped"]))
+        gtk.main_quit()
+
     ##### Application logic follows #####
     # Menu-item callbacks
     def on_quit_activate(self, menuitem):
-        gtk.main_quit()
+        self.__shutdown()
 
     def on_show_completed_toggled(self, menuitem):
         debug("active: %s" % (menuitem.get_active()))
         if menuitem.get_active():
+            if not self.archive_loaded and hasattr(self.backing_store, "load_archive"):
+                self.backing_store.load_archive()
+                self.archive_loaded = True
             self.task_store_filter.remove(self.completed_filter)
             self.project_store_filter_by_area.remove(self.completed_filter)
             self.project_store_filter_by_realm_no_action.remove(self.completed_filter)
@@ -530,4 +594,4 @@ class BrainDump(object):
         GUI().get_widget("show_new_task_defaults").widget.set_active(False)
 
     def on_window_destroy(self, widget):
-        gtk.main_quit()
+        self.__shutdown()
@@ -64,4 +64,21 @@ class Config(ConfigObj):
         }
         self['filters'] = filters
 
+        sync = {
+            'watch_data_dir':True
+        }
+        self['sync'] = sync
+
+        store = {
+            'backend':'xml',
+            'jobs':0,
+            'durability':'batch',
+            'layout':'flat',
+            'archive_days':0,
+            'lazy_notes':True,
+            'dates':'text',
+            'compact_ids':False
+        }
+        self['store'] = store
+
         self.write()
@@ -20,26 +20,60 @@
 #
 # 2007-Jun-30:	Initial version by Darren Hart <darren@dvhart.com>
 
+from __future__ import with_statement
 from gobject import *
-from uuid import uuid4
-import pickle
+from uuid import uuid4, UUID
+import threading
 from singleton import *
 from oproperty import *
+from lru import LRUCache
+from orderedset import OrderedSet
 from gui.friendly_date import *
 from logging import debug, info, warning, error, critical
 
+# Characters of lazily loaded notes (see GTD.load_notes) to keep in memory
+NOTES_CACHE_SIZE = 1024 * 1024
+
 # FIXME: consider adding adding function pointers to the GTD() signals, then
 # I wouldn't need to override so may functions (like set_title) they could
 # could all just use the base implementation which would call self._sig_rename()
 
+class _SignalName(object):
+    '''The name of the <class>_<suffix> signal (task_modified, ...) of the
+    class it is read from, one interned string per class.'''
+
+    def __init__(self, suffix):
+        self.__suffix = suffix
+        self.__names = {} # class -> name
+
+    def __get__(self, obj, cls):
+        name = self.__names.get(cls, None)
+        if name is None:
+            name = intern(cls.__name__.lower() + "_" + self.__suffix)
+            self.__names[cls] = name
+        return name
+
+
+# The gtd objects keep their attributes in __slots__ rather than an instance
+# __dict__, which is most of the memory a large tree takes.  Classes deriving
+# from them must declare __slots__ as well, or their instances get a __dict__
+# back (the None path singletons have one, from BaseNone).
 class Base(object):
+    __slots__ = ("__id", "__title")
+
+    # Keep the ids as ints (longs) instead of UUIDs, about 350 bytes less per
+    # object.  The id property still returns a UUID, built on each access.
+    compact_ids = False
+
+    _modified_signal = _SignalName("modified")
+
     def __init__(self, id, title):
         if id is None:
-            self.id = uuid4()
-        else:
-            self.id = id
+            id = uuid4()
+        if Base.compact_ids and isinstance(id, UUID):
+            id = id.int
+        self.__id = id
         self.__title = title
-        self._signal_prefix = self.__class__.__name__.lower() + "_"
 
     def __cmp__(self, obj):
         if not isinstance(obj, Base):
@@ -53,10 +87,22 @@ class Base(object):
                 return 0
         return 1
 
+    def get_id(self):
+        if isinstance(self.__id, UUID):
+            return self.__id
+        return UUID(int=self.__id)
+
+    def get_id_int(self):
+        if isinstance(self.__id, UUID):
+            return self.__id.int
+        return self.__id
+
     def set_title(self, title):
         self.__title = title
-        GTD().emit(self._signal_prefix + "modified", self)
+        GTD().emit(self._modified_signal, self)
 
+    id = OProperty(get_id, None)
+    id_int = OProperty(get_id_int, None) # the key of the GTD id index
     title = OProperty(lambda s: s.__title, set_title)
 
 class BaseNone(object):
@@ -64,7 +110,67 @@ class BaseNone(object):
     pass
 
 
+class TaskCounts(object):
+    '''The number of tasks under a realm, area, or project by state, and of
+    the completed ones by ISO week, kept up to date by the containers.'''
+    __slots__ = ("__states", "__weeks", "__total")
+
+    def __init__(self):
+        # indexed by Actionable.state, 1 to 8 (INITIAL), Actionable is not
+        # defined yet when the None path singletons are created
+        self.__states = [0] * 9
+        self.__weeks = {} # (ISO year, ISO week) -> complete tasks
+        self.__total = 0
+
+    def count(self, state=None):
+        '''Return the number of tasks, or of those in state.'''
+        if state is None:
+            return self.__total
+        return self.__states[state]
+
+    def open(self):
+        '''Return the number of tasks that are not complete.'''
+        return self.__total - self.__states[Actionable.COMPLETE]
+
+    def completed_in_week(self, day):
+        '''Return the number of tasks completed in the ISO week of day (a
+        date or datetime).'''
+        return self.__weeks.get(day.isocalendar()[:2], 0)
+
+    def add(self, state, week, n):
+        '''Count n more (or, if n is negative, fewer) tasks in state,
+        completed in week (None unless state is COMPLETE).'''
+        self.__states[state] = self.__states[state] + n
+        self.__total = self.__total + n
+        if week is not None:
+            n = self.__weeks.get(week, 0) + n
+            if n:
+                self.__weeks[week] = n
+            else:
+                del self.__weeks[week]
+
+    def items(self):
+        '''Return the counts as a list of (state, week, n) which add() would
+        count again.'''
+        items = []
+        for state, n in enumerate(self.__states):
+            if n and state != Actionable.COMPLETE:
+                items.append((state, None, n))
+        for week, n in self.__weeks.iteritems():
+            items.append((Actionable.COMPLETE, week, n))
+        return items
+
+
+def _count_child(container, child, sign):
+    '''Count (sign 1) or uncount (sign -1) the tasks of child, an area or a
+    project, in container and the containers above it.'''
+    for state, week, n in child.task_counts.items():
+        container._count_tasks(state, week, sign * n)
+
+
 class Context(Base):
+    __slots__ = ()
+
     def create(id=None, title=""):
         context = Context(id, title)
         GTD()._add_context(context)
@@ -86,6 +192,8 @@ class ContextNone(Context, BaseNone):
 
 
 class Realm(Base):
+    __slots__ = ("areas", "visible", "task_counts")
+
     def create(id=None, title="", visible=True):
         realm = Realm(id, title, visible)
         GTD()._add_realm(realm)
@@ -93,7 +201,8 @@ class Realm(Base):
     create = staticmethod(create)
 
     def __init__(self, id, title, visible):
-        self.areas = []
+        self.areas = OrderedSet()
+        self.task_counts = TaskCounts()
         self.visible = visible
         Base.__init__(self, id, title)
 
@@ -104,10 +213,16 @@ class Realm(Base):
         return tasks
 
     def add_area(self, area):
-        self.areas.append(area)
+        if not area in self.areas:
+            self.areas.append(area)
+            _count_child(self, area, 1)
 
     def remove_area(self, area):
         self.areas.remove(area)
+        _count_child(self, area, -1)
+
+    def _count_tasks(self, state, week, n):
+        self.task_counts.add(state, week, n)
 
     def set_visible(self, visible):
         self.visible = visible
@@ -122,17 +237,24 @@ class RealmNone(Base, BaseNone):
     def __init__(self):
         Base.__init__(self, None, "No Realm")
         self.visible = True
-        self.areas = []
+        self.areas = OrderedSet()
+        self.task_counts = TaskCounts()
 
     def set_title(self, title):
         debug('Oops, tried to set title on %s' % (self.__class__.__name__))
 
     def add_area(self, area):
-        self.areas.append(area)
+        if not area in self.areas:
+            self.areas.append(area)
+            _count_child(self, area, 1)
 
     def remove_area(self, area):
         if area is not AreaNone():
             self.areas.remove(area)
+            _count_child(self, area, -1)
+
+    def _count_tasks(self, state, week, n):
+        self.task_counts.add(state, week, n)
 
     def get_tasks(self):
         tasks = []
@@ -142,6 +264,8 @@ class RealmNone(Base, BaseNone):
 
 
 class Area(Base):
+    __slots__ = ("projects", "__realm", "task_counts")
+
     def create(id=None, title="", realm=RealmNone()):
         area = Area(id, title, realm)
         GTD().emit("area_added", area)
@@ -149,7 +273,8 @@ class Area(Base):
     create = staticmethod(create)
 
     def __init__(self, id, title, realm):
-        self.projects = []
+        self.projects = OrderedSet()
+        self.task_counts = TaskCounts()
         Base.__init__(self, id, title)
         self.__realm = realm
         self.__realm.add_area(self)
@@ -169,10 +294,17 @@ class Area(Base):
         return tasks
 
     def add_project(self, project):
-        self.projects.append(project)
+        if not project in self.projects:
+            self.projects.append(project)
+            _count_child(self, project, 1)
 
     def remove_project(self, project):
         self.projects.remove(project)
+        _count_child(self, project, -1)
+
+    def _count_tasks(self, state, week, n):
+        self.task_counts.add(state, week, n)
+        self.__realm._count_tasks(state, week, n)
 
     realm = OProperty(lambda s: s.__realm, set_realm)
 
@@ -182,7 +314,8 @@ class AreaNone(Base, BaseNone):
 
     def __init__(self):
         Base.__init__(self, None, "No Area")
-        self.projects = []
+        self.projects = OrderedSet()
+        self.task_counts = TaskCounts()
         self.realm = RealmNone()
         self.realm.add_area(self)
     
@@ -190,11 +323,18 @@ class AreaNone(Base, BaseNone):
         debug('Oops, tried to set title on %s' % (self.__class__.__name__))
 
     def add_project(self, project):
-        self.projects.append(project)
+        if not project in self.projects:
+            self.projects.append(project)
+            _count_child(self, project, 1)
 
     def remove_project(self, project):
         if project is not ProjectNone():
             self.projects.remove(project)
+            _count_child(self, project, -1)
+
+    def _count_tasks(self, state, week, n):
+        self.task_counts.add(state, week, n)
+        self.realm._count_tasks(state, week, n)
 
     def get_tasks(self):
         tasks = []
@@ -205,6 +345,7 @@ class AreaNone(Base, BaseNone):
 
 class Actionable(Base):
     '''Base Class for Project and Task'''
+    __slots__ = ("__notes", "__start_date", "__due_date", "__complete", "__state")
 
     # FIXME: consider some kind of an enum or other more structured approach.
     OVERDUE  = 1 # the due date has passed
@@ -216,6 +357,8 @@ class Actionable(Base):
     COMPLETE = 7 # Actionable.complete is not None - this is redundant...
     INITIAL  = 8
 
+    # notes may be None, meaning they are left in the backing store until
+    # they are first read (see GTD.load_notes)
     def __init__(self, id, title, notes):
         Base.__init__(self, id, title)
         self.__notes = notes
@@ -225,7 +368,8 @@ class Actionable(Base):
         self.__state = Actionable.INITIAL
 
     # FIXME: this needs to be called on all Actionables in the tree everytime the system date changes
-    def __set_state(self):
+    # counted is the (state, complete_week) before the change
+    def __set_state(self, counted):
         state = Actionable.INITIAL
         if self.__complete:
             state = Actionable.COMPLETE
@@ -251,6 +395,19 @@ class Actionable(Base):
                 else:
                     state = Actionable.SOMEDAY
         self.__state = state
+        if counted != (state, self.complete_week):
+            self._counts_changed(counted)
+
+    def _counts_changed(self, counted):
+        '''Called when the state or complete_week changed from counted, the
+        (state, complete_week) the containers counted it with.'''
+        pass
+
+    def get_complete_week(self):
+        '''Return the ISO (year, week) of the complete date, or None.'''
+        if self.__complete:
+            return self.__complete.isocalendar()[:2]
+        return None
 
     def set_complete(self, complete):
         if complete == True:
@@ -259,32 +416,48 @@ class Actionable(Base):
             complete = None
         elif complete is not None:
             assert isinstance(complete, datetime)
+        counted = (self.__state, self.complete_week)
         self.__complete = complete
-        self.__set_state()
-        GTD().emit(self._signal_prefix + "modified", self)
+        self.__set_state(counted)
+        GTD().emit(self._modified_signal, self)
+
+    def get_notes(self):
+        if self.__notes is None:
+            return GTD().load_notes(self)
+        return self.__notes
 
     def set_notes(self, notes):
+        if notes is None:
+            notes = ""
+        if self.__notes is None:
+            GTD().forget_notes(self)
         self.__notes = notes
-        GTD().emit(self._signal_prefix + "modified", self)
+        GTD().emit(self._modified_signal, self)
 
     def set_start_date(self, start_date):
+        counted = (self.__state, self.complete_week)
         self.__start_date = start_date
-        self.__set_state()
-        GTD().emit(self._signal_prefix + "modified", self)
+        self.__set_state(counted)
+        GTD().emit(self._modified_signal, self)
 
     def set_due_date(self, due_date):
+        counted = (self.__state, self.complete_week)
         self.__due_date = due_date
-        self.__set_state()
-        GTD().emit(self._signal_prefix + "modified", self)
+        self.__set_state(counted)
+        GTD().emit(self._modified_signal, self)
 
-    notes = OProperty(lambda s: s.__notes, set_notes)
+    notes = OProperty(get_notes, set_notes)
+    loaded_notes = OProperty(lambda s: s.__notes, None) # None if not loaded yet
     start_date = OProperty(lambda s: s.__start_date, set_start_date)
     due_date = OProperty(lambda s: s.__due_date, set_due_date)
     complete = OProperty(lambda s: s.__complete, set_complete)
+    complete_week = OProperty(get_complete_week, None)
     state = OProperty(lambda s: s.__state, None)
 
 
 class Project(Actionable):
+    __slots__ = ("tasks", "__area", "task_counts")
+
     def create(id=None, title="", notes="", area=None):
         project = Project(id, title, notes, area)
         GTD().emit("project_added", project)
@@ -292,7 +465,8 @@ class Project(Actionable):
     create = staticmethod(create)
 
     def __init__(self, id, title, notes, area):
-        self.tasks = []
+        self.tasks = OrderedSet()
+        self.task_counts = TaskCounts()
         Actionable.__init__(self, id, title, notes)
         if area:
             self.__area = area
@@ -305,10 +479,17 @@ class Project(Actionable):
         GTD().emit("project_modified", self)
 
     def add_task(self, task):
-        self.tasks.append(task)
+        if not task in self.tasks:
+            self.tasks.append(task)
+            self._count_tasks(task.state, task.complete_week, 1)
 
     def remove_task(self, task):
         self.tasks.remove(task)
+        self._count_tasks(task.state, task.complete_week, -1)
+
+    def _count_tasks(self, state, week, n):
+        self.task_counts.add(state, week, n)
+        self.__area._count_tasks(state, week, n)
 
     area = OProperty(lambda s: s.__area, set_area)
 
@@ -318,7 +499,8 @@ class ProjectNone(Base, BaseNone):
 
     def __init__(self):
         Base.__init__(self, None, "No Project")
-        self.tasks = []
+        self.tasks = OrderedSet()
+        self.task_counts = TaskCounts()
         self.area = AreaNone()
         self.area.add_project(self)
         self.notes = ""
@@ -330,13 +512,22 @@ class ProjectNone(Base, BaseNone):
         debug('Oops, tried to set title on %s' % (self.__class__.__name__))
 
     def add_task(self, task):
-        self.tasks.append(task)
+        if not task in self.tasks:
+            self.tasks.append(task)
+            self._count_tasks(task.state, task.complete_week, 1)
 
     def remove_task(self, task):
         self.tasks.remove(task)
+        self._count_tasks(task.state, task.complete_week, -1)
+
+    def _count_tasks(self, state, week, n):
+        self.task_counts.add(state, week, n)
+        self.area._count_tasks(state, week, n)
 
 
 class Task(Actionable):
+    __slots__ = ("__project", "__contexts", "__waiting")
+
     def create(id=None, title="", project=None, contexts=None, notes="", waiting=False):
         task = Task(id, title, project, contexts, notes, waiting)
         GTD().emit("task_added", task)
@@ -366,20 +557,81 @@ class Task(Actionable):
             self.__project = ProjectNone()
         GTD().emit("task_modified", self)
 
+    def _counts_changed(self, counted):
+        # a task removed from the tree still refers to its project
+        if self in self.__project.tasks:
+            self.__project._count_tasks(counted[0], counted[1], -1)
+            self.__project._count_tasks(self.state, self.complete_week, 1)
+
     def add_context(self, context):
         if self.__contexts.count(context) == 0:
             self.__contexts.append(context)
+            GTD()._index_context(self, context)
             GTD().emit("task_modified", self)
 
     def remove_context(self, context):
         if self.__contexts.count(context):
             self.__contexts.remove(context)
+            GTD()._unindex_context(self, context)
             GTD().emit("task_modified", self)
 
     contexts = OProperty(lambda s: frozenset(s.__contexts), None)
     project = OProperty(lambda s: s.__project, set_project)
 
 
+class ChangeSet(object):
+    '''The signals emitted on the GTD tree during a transaction, each object
+    reported at most once per kind of change.'''
+
+    def __init__(self, origin=None):
+        self.origin = origin # who made the changes, see GTD.transaction()
+        self.signals = []    # (signal, obj) in emission order
+        self.__last = {}     # id(obj) -> the last signal recorded for obj
+
+    def add(self, signal, obj):
+        last = self.__last.get(id(obj), None)
+        if last is not None:
+            if signal == last:
+                if not signal.endswith("_added") and not signal.endswith("_removed"):
+                    return
+            elif signal.endswith("_modified") and last.endswith("_added"):
+                return
+        self.__last[id(obj)] = signal
+        self.signals.append((signal, obj))
+
+    def objects(self, signal):
+        '''Return the objects recorded with signal.'''
+        return [o for s,o in self.signals if s == signal]
+
+    def __len__(self):
+        return len(self.signals)
+
+
+class Transaction(object):
+    '''Context manager for GTD().transaction().'''
+
+    def __init__(self, tree, origin):
+        self.__tree = tree
+        self.__origin = origin
+
+    def __enter__(self):
+        self.__tree.begin_transaction(self.__origin)
+        return self.__tree
+
+    def __exit__(self, type, value, traceback):
+        # The objects have already been changed, there is nothing to roll back
+        # to, so the changes are always delivered.
+        self.__tree.commit_transaction()
+        return False
+
+
+# The id index updates made by the *_added and *_removed signals, True adds
+# the object to the index and False removes it (see GTD.lookup)
+_INDEX_SIGNALS = {}
+for _type in ["context", "realm", "area", "project", "task"]:
+    _INDEX_SIGNALS[_type + "_added"] = True
+    _INDEX_SIGNALS[_type + "_removed"] = False
+
 # The top-level GTD tree
 class GTD(gobject.GObject):
     __metaclass__ = GSingleton
@@ -399,7 +651,9 @@ class GTD(gobject.GObject):
                     'task_removed'          : (SIGNAL_RUN_FIRST, TYPE_NONE, (TYPE_PYOBJECT,)),
                     'context_modified'      : (SIGNAL_RUN_FIRST, TYPE_NONE, (TYPE_PYOBJECT,)),
                     'context_added'         : (SIGNAL_RUN_FIRST, TYPE_NONE, (TYPE_PYOBJECT,)),
-                    'context_removed'       : (SIGNAL_RUN_FIRST, TYPE_NONE, (TYPE_PYOBJECT,))
+                    'context_removed'       : (SIGNAL_RUN_FIRST, TYPE_NONE, (TYPE_PYOBJECT,)),
+                    'tree_built'            : (SIGNAL_RUN_FIRST, TYPE_NONE, (TYPE_PYOBJECT,)),
+                    'changes_committed'     : (SIGNAL_RUN_FIRST, TYPE_NONE, (TYPE_PYOBJECT,))
                    }
 
     def __init__(self):
@@ -408,6 +662,133 @@ class GTD(gobject.GObject):
         self.realms = [RealmNone()]
         AreaNone()
         ProjectNone()
+        self.__build_depth = 0
+        self.__built = []
+        self.__transaction_depth = 0
+        self.__changes = None
+        self.__committing = False
+        self.__commit_origin = None
+        self.notes_loader = None
+        self.__notes_cache = LRUCache(NOTES_CACHE_SIZE, len)
+        self.__notes_lock = threading.Lock() # saves read notes from a worker thread
+        self.__index = {} # id_int -> object, see lookup()
+        self.__context_tasks = {} # context -> set of tasks, see context_tasks()
+
+    def emit(self, signal, *args):
+        # Every object added to (or removed from) the tree passes through here,
+        # whether or not its signal is emitted right away
+        add = _INDEX_SIGNALS.get(signal, None)
+        if add is not None and not isinstance(args[0], BaseNone):
+            obj = args[0]
+            key = obj.id_int
+            if add:
+                self.__index[key] = obj
+                if signal == "task_added":
+                    for c in obj.contexts:
+                        self._index_context(obj, c)
+            elif self.__index.get(key, None) is obj:
+                del self.__index[key]
+                if signal == "task_removed":
+                    for c in obj.contexts:
+                        self._unindex_context(obj, c)
+        # While building, the per object signals are replaced by a single
+        # tree_built signal (see begin_build)
+        if self.__build_depth:
+            if signal.endswith("_added"):
+                self.__built.append(args[0])
+            return
+        # While in a transaction, the per object signals are collected and
+        # emitted on commit (see begin_transaction)
+        if self.__transaction_depth and len(args) == 1 and \
+           signal not in ["tree_built", "changes_committed"]:
+            self.__changes.add(signal, args[0])
+            return
+        gobject.GObject.emit(self, signal, *args)
+
+    def transaction(self, origin=None):
+        '''Return a context manager wrapping begin/commit_transaction().'''
+        return Transaction(self, origin)
+
+    def begin_transaction(self, origin=None):
+        '''Hold back the per object signals until commit_transaction(), which
+        emits each once with committing set, then changes_committed.  Calls
+        may be nested, origin is commit_origin while committing.'''
+        if self.__transaction_depth == 0:
+            self.__changes = ChangeSet(origin)
+        self.__transaction_depth = self.__transaction_depth + 1
+
+    def commit_transaction(self):
+        self.__transaction_depth = self.__transaction_depth - 1
+        if self.__transaction_depth:
+            return
+        changes = self.__changes
+        self.__changes = None
+        if not len(changes):
+            return
+        debug("committing %d changes" % (len(changes)))
+        self.__committing = True
+        self.__commit_origin = changes.origin
+        try:
+            for signal, obj in changes.signals:
+                gobject.GObject.emit(self, signal, obj)
+        finally:
+            self.__committing = False
+            self.__commit_origin = None
+        self.emit("changes_committed", changes)
+
+    committing = OProperty(lambda s: s.__committing, None)
+    commit_origin = OProperty(lambda s: s.__commit_origin, None)
+
+    def lookup(self, id):
+        '''Return the object with id (a UUID or its string form), or None.'''
+        if isinstance(id, UUID):
+            return self.__index.get(id.int, None)
+        try:
+            return self.__index.get(UUID(id).int, None)
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+    def objects(self):
+        '''Return a dict of id -> object for every (non None path) object.'''
+        objects = {}
+        for obj in self.__index.itervalues():
+            objects[obj.id] = obj
+        return objects
+
+    def load_notes(self, obj):
+        '''Return the notes of obj, read by notes_loader(obj) and cached.'''
+        self.__notes_lock.acquire()
+        try:
+            notes = self.__notes_cache.get(obj.id)
+            if notes is None:
+                notes = ""
+                if self.notes_loader:
+                    notes = self.notes_loader(obj) or ""
+                self.__notes_cache.put(obj.id, notes)
+            return notes
+        finally:
+            self.__notes_lock.release()
+
+    def forget_notes(self, obj):
+        '''Drop the cached notes of obj, they changed in the backing store.'''
+        self.__notes_lock.acquire()
+        try:
+            self.__notes_cache.discard(obj.id)
+        finally:
+            self.__notes_lock.release()
+
+    def begin_build(self):
+        '''Start adding objects in bulk, without per object signals, until the
+        outermost end_build().'''
+        self.__build_depth = self.__build_depth + 1
+
+    def end_build(self):
+        '''Finish a bulk build and emit tree_built with the new objects.'''
+        self.__build_depth = self.__build_depth - 1
+        if self.__build_depth == 0:
+            built = self.__built
+            self.__built = []
+            self.emit("tree_built", built)
 
     def _add_context(self, context):
         self.contexts.append(context)
@@ -417,64 +798,86 @@ class GTD(gobject.GObject):
         self.realms.append(realm)
         self.emit("realm_added", realm)
 
+    def _index_context(self, task, context):
+        '''Called by Task.add_context(), and for each of its contexts when a
+        task is added to the tree.'''
+        if self.__index.get(task.id_int, None) is task:
+            tasks = self.__context_tasks.get(context, None)
+            if tasks is None:
+                tasks = self.__context_tasks[context] = set()
+            tasks.add(task)
+
+    def _unindex_context(self, task, context):
+        tasks = self.__context_tasks.get(context, None)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self.__context_tasks[context]
+
     def context_tasks(self, context):
+        '''Return the tasks of the visible realms in context, in no particular
+        order.'''
         tasks = []
-        for r in self.realms:
-            if r.visible:
-                for t in r.get_tasks():
-                    if context in t.contexts:
-                        tasks.append(t)
+        for t in self.__context_tasks.get(context, ()):
+            if t.project.area.realm.visible:
+                tasks.append(t)
         return tasks
 
     def remove_context(self, context):
-        for r in self.realms:
-            for t in r.get_tasks():
+        with self.transaction():
+            for t in list(self.__context_tasks.get(context, ())):
                 t.remove_context(context)
-        self.contexts.remove(context)
-        self.emit("context_removed", context)
+            self.contexts.remove(context)
+            self.emit("context_removed", context)
 
     def remove_realm(self, realm, recurse=False):
         # FIXME: throw exception for input errors?
         if not realm == RealmNone():
-            for a in realm.areas:
-                if recurse:
-                    self.remove_area(a, recurse)
-                else:
-                    a.realm.remove_area(a)
-                    self.emit("area_removed", a)
-                    RealmNone().add_area(a)
-                    self.emit("area_added", a)
-            self.realms.remove(realm)
-            self.emit("realm_removed", realm)
+            with self.transaction():
+                for a in list(realm.areas):
+                    if recurse:
+                        self.remove_area(a, recurse)
+                    else:
+                        a.realm.remove_area(a)
+                        self.emit("area_removed", a)
+                        RealmNone().add_area(a)
+                        self.emit("area_added", a)
+                        a.realm = RealmNone()
+                self.realms.remove(realm)
+                self.emit("realm_removed", realm)
 
     def remove_area(self, area, recurse=False):
         # FIXME: throw exception for input errors?
         if area.realm and not area == AreaNone():
-            for p in area.projects:
-                if recurse:
-                    self.remove_project(p, recurse)
-                else:
-                    p.area.remove_project(p)
-                    self.emit("project_removed", p)
-                    AreaNone().add_project(p)
-                    self.emit("project_added", p)
-            area.realm.remove_area(area)
-            self.emit("area_removed", area)
+            with self.transaction():
+                for p in list(area.projects):
+                    if recurse:
+                        self.remove_project(p, recurse)
+                    else:
+                        p.area.remove_project(p)
+                        self.emit("project_removed", p)
+                        AreaNone().add_project(p)
+                        self.emit("project_added", p)
+                        p.area = AreaNone()
+                area.realm.remove_area(area)
+                self.emit("area_removed", area)
 
     def remove_project(self, project, recurse=False):
         # FIXME: throw exception for input errors?
         if project.area and not project == ProjectNone():
-            for t in project.tasks:
-                if recurse:
-                    self.remove_task(t, recurse)
-                else:
-                    t.project.remove_task(t)
-                    # FIXME: maybe task_changed is adequate here...
-                    self.emit("task_removed", t)
-                    ProjectNone().add_task(t)
-                    self.emit("task_added", t)
-            project.area.remove_project(project)
-            self.emit("project_removed", project)
+            with self.transaction():
+                for t in list(project.tasks):
+                    if recurse:
+                        self.remove_task(t)
+                    else:
+                        t.project.remove_task(t)
+                        # FIXME: maybe task_changed is adequate here...
+                        self.emit("task_removed", t)
+                        ProjectNone().add_task(t)
+                        self.emit("task_added", t)
+                        t.project = ProjectNone()
+                project.area.remove_project(project)
+                self.emit("project_removed", project)
 
     def remove_task(self, task):
         if task.project:
@@ -122,6 +122,7 @@ class GTDStore(gobject.GObject):
         self.model.set_sort_func(1, self.__gtd_sort)
         self.model.set_sort_column_id(1, gtk.SORT_ASCENDING)
         self._by_due_date = False
+        self.__modified = {} # id(obj) -> obj modified during a transaction commit
 
     def __gtd_sort(self, model, iter1, iter2):
         obj1 = self.model[iter1][0]
@@ -188,6 +189,11 @@ class GTDStore(gobject.GObject):
 
     # FIXME: this is getting called whenever the cursor changes...
     def on_gtd_modified(self, tree, obj):
+        # Modifications in a transaction are handled all at once when the
+        # changes are committed
+        if tree.committing:
+            self.__modified[id(obj)] = obj
+            return
         iter = self.gtd_iter(obj)
         if iter:
             self.model.row_changed(self.model.get_path(iter), iter)
@@ -195,6 +201,19 @@ class GTDStore(gobject.GObject):
             #        there has to be a better way...
             self.model.set_sort_func(1, self.__gtd_sort)
 
+    def on_gtd_committed(self, tree, changes):
+        if not self.__modified:
+            return
+        # One pass over the rows, and one resort, for all the modified objects
+        iter = self.model.get_iter_first()
+        while iter and self.__modified:
+            if id(self.model[iter][0]) in self.__modified:
+                del self.__modified[id(self.model[iter][0])]
+                self.model.row_changed(self.model.get_path(iter), iter)
+            iter = self.model.iter_next(iter)
+        self.__modified = {}
+        self.model.set_sort_func(1, self.__gtd_sort)
+
     def on_gtd_added(self, tree, obj):
         self.add(obj)
 
@@ -0,0 +1,290 @@
+#    Filename: journalstore.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: single file, append-only journal backing store
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Apr-04:  Initial version by Darren Hart <darren@dvhart.com>
+
+import os, os.path
+import threading
+import cPickle as pickle
+from cStringIO import StringIO
+from records import *
+from backend import Backend
+from logging import debug, info, warning, error, critical
+
+JOURNAL_NAME = "braindump.journal"
+
+# What cPickle raises reading a partial or damaged entry
+_BAD_ENTRY = (EOFError, pickle.UnpicklingError, ValueError, KeyError, IndexError,
+              TypeError, AttributeError, ImportError)
+
+# Entries are pickled with protocol 2, which starts every pickle with these
+_ENTRY_START = "\x80\x02"
+
+# Compact once the journal holds this many entries more than there are live
+# objects (and at least twice as many entries as live objects).
+COMPACT_MIN_ENTRIES = 1000
+
+class JournalStore(Backend):
+    '''Store every gtd object in a single append-only journal of ("save",
+    record) and ("delete", id) entries, compacted in a background thread.'''
+
+    def __init__(self):
+        Backend.__init__(self)
+        self.__path = None
+        self.__fd = None
+        self.__live = {}        # id -> latest record
+        self.__entries = 0      # entries in the journal file
+        self.__lock = threading.Lock()
+        self.__compactor = None # the compaction thread, if running
+        self.__tail = None      # entries appended while compacting
+
+    def _journal_filename(self):
+        return os.path.join(self.__path, JOURNAL_NAME)
+
+    def load(self, path):
+        if path is None:
+            critical("no path specified")
+        elif not os.path.exists(path):
+            critical("specified path does not exist: %s" % (path))
+        self.__path = path
+
+        self.__live = self.__replay()
+        builder = TreeBuilder()
+        builder.extend(self.__live.values())
+        builder.build()
+
+        self.__fd = open(self._journal_filename(), "ab")
+        self.__maybe_compact()
+
+    def __replay(self):
+        live = {}
+        self.__entries = 0
+        filename = self._journal_filename()
+        if not os.path.exists(filename):
+            return live
+
+        size = os.path.getsize(filename)
+        later = []
+        fd = open(filename, "rb")
+        try:
+            good = 0
+            while True:
+                try:
+                    entry = _read_entry(fd)
+                except _BAD_ENTRY:
+                    break
+                good = fd.tell()
+                self.__replay_entry(live, entry)
+            if good < size:
+                fd.seek(0)
+                later = _later_entries(fd.read(), good)
+        finally:
+            fd.close()
+        if good == size:
+            pass
+        elif not later:
+            # A crash during an append leaves a partial entry at the end, drop
+            # it so new entries are appended after the last good one.
+            warning("truncating partial journal entry at offset %d of %s" %
+                    (good, filename))
+            fd = open(filename, "r+b")
+            try:
+                fd.truncate(good)
+            finally:
+                fd.close()
+        else:
+            # Damage in the middle: keep the journal as it is and go on with
+            # a new one holding everything that could be read.
+            corrupt = filename + ".corrupt"
+            error("unreadable journal entry at offset %d of %s, %d readable "
+                  "entries follow it, the journal was moved to %s" %
+                  (good, filename, len(later), corrupt))
+            for entry in later:
+                self.__replay_entry(live, entry)
+            os.rename(filename, corrupt)
+            tmp = filename + ".recover"
+            fd = open(tmp, "wb")
+            try:
+                write_journal(fd, live.values())
+                fd.flush()
+                os.fsync(fd.fileno())
+            finally:
+                fd.close()
+            os.rename(tmp, filename)
+            self.__entries = len(live)
+        debug("replayed %d journal entries, %d live objects" % (self.__entries, len(live)))
+        return live
+
+    def __replay_entry(self, live, entry):
+        self.__entries = self.__entries + 1
+        if entry[0] == "save":
+            live[entry[1]["id"]] = entry[1]
+        elif entry[0] == "delete":
+            if entry[1] in live:
+                del live[entry[1]]
+
+    def __append(self, entry):
+        self.__lock.acquire()
+        try:
+            pickle.dump(entry, self.__fd, pickle.HIGHEST_PROTOCOL)
+            self.__fd.flush()
+            self.__entries = self.__entries + 1
+            if entry[0] == "save":
+                self.__live[entry[1]["id"]] = entry[1]
+            elif entry[1] in self.__live:
+                del self.__live[entry[1]]
+            if self.__tail is not None:
+                self.__tail.append(entry)
+        finally:
+            self.__lock.release()
+        self.__maybe_compact()
+
+    def save_object(self, obj):
+        self.__append(("save", object_record(obj)))
+
+    def delete_object(self, obj):
+        self.__append(("delete", obj.id))
+
+    def __maybe_compact(self):
+        if self.__compactor:
+            return
+        live = len(self.__live)
+        if self.__entries > live + COMPACT_MIN_ENTRIES and self.__entries > 2 * live:
+            self.compact()
+
+    def compact(self):
+        '''Rewrite the journal with one entry per live object in the background.'''
+        if self.__compactor:
+            return
+        self.__lock.acquire()
+        try:
+            records = self.__live.values()
+            self.__tail = []
+        finally:
+            self.__lock.release()
+        info("compacting %s: %d entries, %d live objects" %
+             (self._journal_filename(), self.__entries, len(records)))
+        self.__compactor = threading.Thread(target=self.__compact, args=(records,))
+        self.__compactor.setDaemon(True)
+        self.__compactor.start()
+
+    def __compact(self, records):
+        filename = self._journal_filename()
+        tmp = filename + ".compact"
+        fd = open(tmp, "wb")
+        try:
+            write_journal(fd, records)
+            # Anything appended since we took the snapshot goes in after it
+            self.__lock.acquire()
+            try:
+                for entry in self.__tail:
+                    pickle.dump(entry, fd, pickle.HIGHEST_PROTOCOL)
+                fd.flush()
+                os.fsync(fd.fileno())
+                fd.close()
+                os.rename(tmp, filename)
+                self.__fd.close()
+                self.__fd = open(filename, "ab")
+                self.__entries = len(records) + len(self.__tail)
+                self.__tail = None
+            finally:
+                self.__lock.release()
+        except:
+            error("failed to compact %s" % (filename))
+            if not fd.closed:
+                fd.close()
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            self.__lock.acquire()
+            self.__tail = None
+            self.__lock.release()
+        self.__compactor = None
+
+    def close(self):
+        compactor = self.__compactor
+        if compactor:
+            compactor.join()
+        if self.__fd:
+            self.__fd.close()
+            self.__fd = None
+
+
+def _read_entry(fd):
+    '''Read the next entry from fd, raise one of _BAD_ENTRY if it isn't one.'''
+    entry = pickle.load(fd)
+    if not isinstance(entry, tuple) or len(entry) != 2 or \
+       not entry[0] in ["save", "delete"] or \
+       (entry[0] == "save" and not (isinstance(entry[1], dict) and "id" in entry[1])):
+        raise pickle.UnpicklingError("not a journal entry")
+    return entry
+
+def _later_entries(data, offset):
+    '''Return the entries that can still be read from the journal data
+    after the bad entry at offset, skipping to the next entry start after
+    each bad one.'''
+    entries = []
+    buf = StringIO(data)
+    pos = data.find(_ENTRY_START, offset + 1)
+    while 0 <= pos < len(data):
+        buf.seek(pos)
+        try:
+            entries.append(_read_entry(buf))
+            pos = buf.tell()
+        except _BAD_ENTRY:
+            pos = data.find(_ENTRY_START, pos + 1)
+    return entries
+
+def write_journal(fd, records):
+    '''Write a "save" entry for each record to the open file fd.'''
+    for rec in records:
+        pickle.dump(("save", rec), fd, pickle.HIGHEST_PROTOCOL)
+
+def migrate_xml(xml_path, journal_path=None, archive=False):
+    '''Write the objects stored as XML files in xml_path to a journal, return
+    how many, or None.  The journal has no archive, archived objects are
+    written as ordinary ones if archive is True, otherwise nothing is.'''
+    from xmlstore import XMLStore
+    from archive import Archive, ARCHIVE_DIR
+    if journal_path is None:
+        journal_path = os.path.join(xml_path, JOURNAL_NAME)
+    if os.path.exists(journal_path):
+        error("refusing to overwrite existing journal: %s" % (journal_path))
+        return None
+    archived = len(Archive(os.path.join(xml_path, ARCHIVE_DIR)).records())
+    if archived and not archive:
+        error("%s holds %d archived objects and a journal has no archive, "
+              "they can only be migrated as ordinary objects" % (xml_path, archived))
+        return None
+
+    store = XMLStore()
+    store.load(xml_path)
+    if archived:
+        info("migrating %d archived objects" % (len(store.load_archive())))
+    records = tree_records()
+    tmp = journal_path + ".migrate"
+    fd = open(tmp, "wb")
+    try:
+        write_journal(fd, records)
+        fd.flush()
+        os.fsync(fd.fileno())
+    finally:
+        fd.close()
+    os.rename(tmp, journal_path)
+    return len(records)
@@ -0,0 +1,94 @@
+#    Filename: lru.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: bounded least recently used cache
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-13:  Initial version by Darren Hart <darren@dvhart.com>
+
+from logging import debug, info, warning, error, critical
+
+# indexes into a link of the recency list
+_PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+class LRUCache(object):
+    '''A dict-like cache dropping the least recently used values once their
+    total weight exceeds capacity.'''
+
+    def __init__(self, capacity, weight=None):
+        self.capacity = capacity
+        if weight is None:
+            weight = lambda v: 1
+        self.__weight = weight
+        self.__total = 0
+        self.__links = {} # key -> link
+        # the recency list is circular, __root.next is the least recently used
+        self.__root = []
+        self.__root[:] = [self.__root, self.__root, None, None]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__links)
+
+    def __contains__(self, key):
+        return key in self.__links
+
+    def __unlink(self, link):
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+
+    def __append(self, link):
+        last = self.__root[_PREV]
+        link[_PREV] = last
+        link[_NEXT] = self.__root
+        last[_NEXT] = link
+        self.__root[_PREV] = link
+
+    def get(self, key, default=None):
+        link = self.__links.get(key, None)
+        if link is None:
+            self.misses = self.misses + 1
+            return default
+        self.hits = self.hits + 1
+        self.__unlink(link)
+        self.__append(link)
+        return link[_VALUE]
+
+    def put(self, key, value):
+        self.discard(key)
+        link = [None, None, key, value]
+        self.__append(link)
+        self.__links[key] = link
+        self.__total = self.__total + self.__weight(value)
+        while self.__total > self.capacity and len(self.__links) > 1:
+            self.discard(self.__root[_NEXT][_KEY])
+
+    def discard(self, key):
+        link = self.__links.pop(key, None)
+        if link:
+            self.__unlink(link)
+            self.__total = self.__total - self.__weight(link[_VALUE])
+
+    def clear(self):
+        self.__links = {}
+        self.__root[:] = [self.__root, self.__root, None, None]
+        self.__total = 0
+
+    def weight(self):
+        '''Return the total weight of the cached values.'''
+        return self.__total
@@ -0,0 +1,85 @@
+#    Filename: orderedset.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: an insertion ordered set, the children of realms, areas and projects
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-27:  Initial version by Darren Hart <darren@dvhart.com>
+
+from logging import debug, info, warning, error, critical
+
+# indexes into a link of the order list
+_PREV, _NEXT, _ITEM = 0, 1, 2
+
+class OrderedSet(object):
+    '''A set which iterates in insertion order, a drop in for the lists the
+    children of realms, areas and projects were kept in.'''
+
+    def __init__(self, items=None):
+        self.__links = {} # item -> link
+        # the order list is circular, __root.next is the first item
+        self.__root = []
+        self.__root[:] = [self.__root, self.__root, None]
+        for item in items or []:
+            self.append(item)
+
+    def __len__(self):
+        return len(self.__links)
+
+    def __contains__(self, item):
+        return item in self.__links
+
+    def __iter__(self):
+        root = self.__root
+        link = root[_NEXT]
+        while link is not root:
+            # the item may be removed while the caller has it
+            next = link[_NEXT]
+            yield link[_ITEM]
+            link = next
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+    def append(self, item):
+        if item in self.__links:
+            return
+        last = self.__root[_PREV]
+        link = [last, self.__root, item]
+        last[_NEXT] = link
+        self.__root[_PREV] = link
+        self.__links[item] = link
+
+    def remove(self, item):
+        if not self.discard(item):
+            raise ValueError("OrderedSet.remove(x): x not in set")
+
+    def discard(self, item):
+        '''Remove item if it is in the set, return whether it was.'''
+        link = self.__links.pop(item, None)
+        if link is None:
+            return False
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+        return True
+
+    def clear(self):
+        self.__links = {}
+        self.__root[:] = [self.__root, self.__root, None]
@@ -0,0 +1,213 @@
+#    Filename: records.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: plain (picklable) records of gtd objects and the tree builder
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Apr-04:  Initial version by Darren Hart <darren@dvhart.com>
+
+import gtd
+from gtd import GTD
+from logging import debug, info, warning, error, critical
+
+# A record is a dict describing a single gtd object without any references to
+# other live objects (references are stored by id).  Every record has 'type',
+# 'id', and 'title'.  The remaining keys depend on the type:
+#
+#   area:    realm
+#   project: notes, start_date, due_date, complete, area
+#   task:    notes, start_date, due_date, complete, project, contexts
+#
+# References to the None path (RealmNone, AreaNone, ProjectNone) are None.
+# notes may be None, the notes were left in the backing store (see
+# GTD.load_notes).
+
+# The order in which objects must be built so references can be resolved
+BUILD_ORDER = ["context", "realm", "area", "project", "task"]
+
+def object_type(obj):
+    return obj.__class__.__name__.lower()
+
+def object_record(obj, lazy=False):
+    '''Return a record describing obj, without the notes not yet loaded if
+    lazy is True.'''
+    type = object_type(obj)
+    rec = {"type":type, "id":obj.id, "title":obj.title}
+    if type == "area":
+        rec["realm"] = None
+        if not isinstance(obj.realm, gtd.BaseNone):
+            rec["realm"] = obj.realm.id
+    elif type in ["project", "task"]:
+        if lazy:
+            rec["notes"] = obj.loaded_notes
+        else:
+            rec["notes"] = obj.notes
+        rec["start_date"] = obj.start_date
+        rec["due_date"] = obj.due_date
+        rec["complete"] = obj.complete
+        if type == "project":
+            rec["area"] = None
+            if not isinstance(obj.area, gtd.BaseNone):
+                rec["area"] = obj.area.id
+        else:
+            rec["project"] = None
+            if not isinstance(obj.project, gtd.BaseNone):
+                rec["project"] = obj.project.id
+            rec["contexts"] = [c.id for c in obj.contexts
+                               if not isinstance(c, gtd.ContextNone)]
+    return rec
+
+def tree_records(lazy=False):
+    '''Return a list of records for every (non None path) object in GTD().'''
+    recs = []
+    for c in GTD().contexts:
+        if not isinstance(c, gtd.BaseNone):
+            recs.append(object_record(c, lazy))
+    for r in GTD().realms:
+        if not isinstance(r, gtd.BaseNone):
+            recs.append(object_record(r, lazy))
+        for a in r.areas:
+            if not isinstance(a, gtd.BaseNone):
+                recs.append(object_record(a, lazy))
+            for p in a.projects:
+                if not isinstance(p, gtd.BaseNone):
+                    recs.append(object_record(p, lazy))
+                for t in p.tasks:
+                    recs.append(object_record(t, lazy))
+    return recs
+
+def tree_objects():
+    '''Return a dict of id -> object for every (non None path) object in GTD().'''
+    return GTD().objects()
+
+def apply_record(obj, rec, builder):
+    '''Update the live object obj to match rec, through its setters.'''
+    type = rec["type"]
+    if obj.title != rec["title"]:
+        obj.title = rec["title"]
+    if type == "area":
+        realm = builder.ref("realm", rec["realm"]) or gtd.RealmNone()
+        if not obj.realm is realm:
+            obj.realm.remove_area(obj)
+            realm.add_area(obj)
+            obj.realm = realm
+    elif type in ["project", "task"]:
+        for field in ["notes", "start_date", "due_date", "complete"]:
+            if field == "notes" and (rec["notes"] is None or obj.loaded_notes is None):
+                # notes that aren't loaded are read from the backing store,
+                # which already has the new ones
+                GTD().forget_notes(obj)
+                continue
+            if getattr(obj, field) != rec[field]:
+                setattr(obj, field, rec[field])
+        if type == "project":
+            area = builder.ref("area", rec["area"]) or gtd.AreaNone()
+            if not obj.area is area:
+                obj.area.remove_project(obj)
+                area.add_project(obj)
+                obj.area = area
+        else:
+            project = builder.ref("project", rec["project"]) or gtd.ProjectNone()
+            if not obj.project is project:
+                obj.project.remove_task(obj)
+                project.add_task(obj)
+                obj.project = project
+            contexts = [builder.ref("context", c) for c in rec["contexts"]]
+            for c in obj.contexts:
+                if not c in contexts:
+                    obj.remove_context(c)
+            for c in contexts:
+                obj.add_context(c)
+
+
+class TreeBuilder(object):
+    '''Build and link gtd objects from records in any order, parents first,
+    resolving references to the objects built or to those in objects.'''
+
+    def __init__(self, objects=None, bulk=True):
+        self.__records = {}
+        self.__bulk = bulk
+        self.objects = objects # id -> gtd object
+        if self.objects is None:
+            self.objects = {}
+
+    def add(self, rec):
+        self.__records[rec["id"]] = rec
+
+    def extend(self, recs):
+        for rec in recs:
+            self.add(rec)
+
+    def ref(self, type, id):
+        '''Return the object of type with id, building it if need be.'''
+        if id is None:
+            return None
+        if id in self.objects:
+            return self.objects[id]
+        rec = self.__records.get(id, None)
+        if rec is None or rec["type"] != type:
+            debug("building placeholder %s for %s" % (type, id))
+            rec = {"type":type, "id":id, "title":""}
+        return self.__build(rec)
+
+    def __build(self, rec):
+        type = rec["type"]
+        id = rec["id"]
+        if type == "context":
+            obj = gtd.Context.create(id, rec["title"])
+        elif type == "realm":
+            obj = gtd.Realm.create(id, rec["title"], rec.get("visible", True))
+        elif type == "area":
+            realm = self.ref("realm", rec.get("realm", None))
+            if realm is None:
+                realm = gtd.RealmNone()
+            obj = gtd.Area.create(id, rec["title"], realm)
+        elif type == "project":
+            area = self.ref("area", rec.get("area", None))
+            obj = gtd.Project.create(id, rec["title"], rec.get("notes", ""), area)
+        elif type == "task":
+            project = self.ref("project", rec.get("project", None))
+            contexts = [self.ref("context", c) for c in rec.get("contexts", [])]
+            obj = gtd.Task.create(id, rec["title"], project, contexts, rec.get("notes", ""))
+        else:
+            error("unknown record type: %s" % (type))
+            return None
+        self.objects[id] = obj
+
+        if type in ["project", "task"]:
+            if rec.get("start_date", None):
+                obj.start_date = rec["start_date"]
+            if rec.get("due_date", None):
+                obj.due_date = rec["due_date"]
+            # always set complete, it computes the initial state
+            obj.complete = rec.get("complete", None)
+        return obj
+
+    def build(self):
+        '''Create every pending record, return the id -> object dict.'''
+        if self.__bulk:
+            GTD().begin_build()
+        try:
+            for type in BUILD_ORDER:
+                for rec in self.__records.values():
+                    if rec["type"] == type and not rec["id"] in self.objects:
+                        self.__build(rec)
+        finally:
+            if self.__bulk:
+                GTD().end_build()
+        self.__records = {}
+        return self.objects
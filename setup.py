@@ -39,6 +39,6 @@ setup(name='braindump',
                   ('share/icons/hicolor/128x128/apps', ['data/icons/128x128/braindump.png']),
                   ('share/icons/hicolor/192x192/apps', ['data/icons/192x192/braindump.png']),
                   ('share/icons/hicolor/256x256/apps', ['data/icons/256x256/braindump.png'])],
-      scripts=['braindump'],
+      scripts=['braindump', 'braindump-xml2journal', 'braindump-migrate'],
      )
 
@@ -0,0 +1,100 @@
+#    Filename: snapshot.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: binary snapshot of the linked tree plus a manifest of the data
+#              directory it was taken from
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-May-09:  Initial version by Darren Hart <darren@dvhart.com>
+
+import os, os.path
+import fnmatch
+import hashlib
+import cPickle as pickle
+from logging import debug, info, warning, error, critical
+
+SNAPSHOT_NAME = "braindump.snapshot"
+
+# Bump when the snapshot contents change, older snapshots are ignored
+_SNAPSHOT_VERSION = 2
+
+# A manifest maps the name of each file in a directory to (size, mtime, digest),
+# digest is the md5 of the file contents, or None if it hasn't been read.
+
+def content_digest(data):
+    '''Return the manifest digest of the file contents data.'''
+    return hashlib.md5(data).hexdigest()
+
+def stat_entry(filename, digest=None):
+    '''Return the manifest entry for filename.'''
+    st = os.stat(filename)
+    return (st.st_size, st.st_mtime, digest)
+
+def scan_manifest(path, pattern="*.xml", subdir=None):
+    '''Return a manifest of the files in path (or its subdir, named
+    subdir/name), without digests.'''
+    manifest = {}
+    dir = path
+    if subdir:
+        dir = os.path.join(path, subdir)
+    for name in os.listdir(dir):
+        if fnmatch.fnmatch(name, pattern):
+            if subdir:
+                name = os.path.join(subdir, name)
+            try:
+                manifest[name] = stat_entry(os.path.join(path, name))
+            except OSError:
+                # removed since the listdir
+                pass
+    return manifest
+
+def manifest_changes(old, new):
+    '''Return (changed, removed) names of new compared to old, by size and
+    mtime.'''
+    changed = [name for name, entry in new.iteritems()
+               if not name in old or old[name][:2] != entry[:2]]
+    removed = [name for name in old if not name in new]
+    return changed, removed
+
+def read_snapshot(filename):
+    '''Return (manifest, records) from filename, or None if it isn't usable.'''
+    if not os.path.exists(filename):
+        return None
+    fd = open(filename, "rb")
+    try:
+        try:
+            snap = pickle.load(fd)
+        except:
+            warning("ignoring unreadable snapshot: %s" % (filename))
+            return None
+    finally:
+        fd.close()
+    if not isinstance(snap, dict) or snap.get("version", None) != _SNAPSHOT_VERSION:
+        info("ignoring snapshot with a different version: %s" % (filename))
+        return None
+    return snap["manifest"], snap["records"]
+
+def write_snapshot(filename, manifest, records):
+    '''Atomically replace filename with a snapshot of manifest and records.'''
+    tmp = filename + ".tmp"
+    fd = open(tmp, "wb")
+    try:
+        pickle.dump({"version":_SNAPSHOT_VERSION, "manifest":manifest, "records":records},
+                    fd, pickle.HIGHEST_PROTOCOL)
+    finally:
+        fd.close()
+    os.rename(tmp, filename)
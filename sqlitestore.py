@@ -0,0 +1,296 @@
+#    Filename: sqlitestore.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: SQLite backing store with indexed queries
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Apr-11:  Initial version by Darren Hart <darren@dvhart.com>
+
+import os, os.path
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+import gtd
+from gtd import GTD
+from records import *
+from backend import Backend
+from logging import debug, info, warning, error, critical
+
+DATABASE_NAME = "braindump.sqlite"
+
+# Dates are stored as text in this format so they sort (and compare) correctly
+_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# References to the None path are stored as NULL
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS context (id TEXT PRIMARY KEY, title TEXT);
+CREATE TABLE IF NOT EXISTS realm (id TEXT PRIMARY KEY, title TEXT);
+CREATE TABLE IF NOT EXISTS area (id TEXT PRIMARY KEY, title TEXT, realm TEXT);
+CREATE TABLE IF NOT EXISTS project (id TEXT PRIMARY KEY, title TEXT, notes TEXT,
+                                    start_date TEXT, due_date TEXT, complete TEXT,
+                                    area TEXT);
+CREATE TABLE IF NOT EXISTS task (id TEXT PRIMARY KEY, title TEXT, notes TEXT,
+                                 start_date TEXT, due_date TEXT, complete TEXT,
+                                 project TEXT);
+CREATE TABLE IF NOT EXISTS task_context (task TEXT, context TEXT,
+                                         PRIMARY KEY (task, context));
+CREATE INDEX IF NOT EXISTS area_realm ON area (realm);
+CREATE INDEX IF NOT EXISTS project_area ON project (area);
+CREATE INDEX IF NOT EXISTS project_due_date ON project (due_date);
+CREATE INDEX IF NOT EXISTS project_start_date ON project (start_date);
+CREATE INDEX IF NOT EXISTS project_complete ON project (complete);
+CREATE INDEX IF NOT EXISTS task_project ON task (project);
+CREATE INDEX IF NOT EXISTS task_due_date ON task (due_date);
+CREATE INDEX IF NOT EXISTS task_start_date ON task (start_date);
+CREATE INDEX IF NOT EXISTS task_complete ON task (complete);
+CREATE INDEX IF NOT EXISTS task_context_context ON task_context (context);
+"""
+
+def _date_str(date):
+    if date:
+        return date.strftime(_DATE_FORMAT)
+    return None
+
+def _str_date(date_str):
+    if date_str:
+        return datetime.strptime(date_str, _DATE_FORMAT)
+    return None
+
+def _id_str(id):
+    if id is None:
+        return None
+    return str(id)
+
+def _str_id(id_str):
+    if id_str is None:
+        return None
+    return uuid.UUID(id_str)
+
+
+class SQLiteStore(Backend):
+    '''Store every gtd object as a row in an SQLite database, which also
+    answers common queries from its indexes.  A batch is one SQL transaction,
+    the lock guards the connection shared by the saving and querying threads.'''
+
+    def __init__(self):
+        Backend.__init__(self)
+        self.__path = None
+        self.__db = None
+        self.__lock = threading.RLock()
+        self.__batch_depth = 0
+
+    def load(self, path):
+        if path is None:
+            critical("no path specified")
+        elif not os.path.exists(path):
+            critical("specified path does not exist: %s" % (path))
+        self.__path = path
+
+        # saves may come from a WriteBehind worker thread
+        self.__db = sqlite3.connect(os.path.join(self.__path, DATABASE_NAME),
+                                    check_same_thread=False)
+        self.__db.executescript(_SCHEMA)
+
+        self.__lock.acquire()
+        try:
+            recs = self.__records()
+        finally:
+            self.__lock.release()
+        builder = TreeBuilder()
+        builder.extend(recs)
+        builder.build()
+
+    def __records(self):
+        db = self.__db
+        recs = []
+        for id, title in db.execute("SELECT id, title FROM context"):
+            recs.append({"type":"context", "id":_str_id(id), "title":title})
+        for id, title in db.execute("SELECT id, title FROM realm"):
+            recs.append({"type":"realm", "id":_str_id(id), "title":title})
+        for id, title, realm in db.execute("SELECT id, title, realm FROM area"):
+            recs.append({"type":"area", "id":_str_id(id), "title":title,
+                         "realm":_str_id(realm)})
+        for row in db.execute("SELECT id, title, notes, start_date, due_date, "
+                              "complete, area FROM project"):
+            recs.append({"type":"project", "id":_str_id(row[0]), "title":row[1],
+                         "notes":row[2], "start_date":_str_date(row[3]),
+                         "due_date":_str_date(row[4]), "complete":_str_date(row[5]),
+                         "area":_str_id(row[6])})
+        contexts = {}
+        for task, context in db.execute("SELECT task, context FROM task_context"):
+            contexts.setdefault(task, []).append(_str_id(context))
+        for row in db.execute("SELECT id, title, notes, start_date, due_date, "
+                              "complete, project FROM task"):
+            recs.append({"type":"task", "id":_str_id(row[0]), "title":row[1],
+                         "notes":row[2], "start_date":_str_date(row[3]),
+                         "due_date":_str_date(row[4]), "complete":_str_date(row[5]),
+                         "project":_str_id(row[6]), "contexts":contexts.get(row[0], [])})
+        return recs
+
+    def __commit(self):
+        # called with the lock held
+        if self.__batch_depth == 0:
+            self.__db.commit()
+
+    def __save(self, sql, args):
+        self.__lock.acquire()
+        try:
+            self.__db.execute(sql, args)
+            self.__commit()
+        finally:
+            self.__lock.release()
+
+    def begin_batch(self):
+        self.__lock.acquire()
+        try:
+            self.__batch_depth = self.__batch_depth + 1
+        finally:
+            self.__lock.release()
+
+    def commit_batch(self):
+        self.__lock.acquire()
+        try:
+            self.__batch_depth = self.__batch_depth - 1
+            self.__commit()
+        finally:
+            self.__lock.release()
+
+    def save_object(self, obj):
+        getattr(self, "save_" + object_type(obj))(obj)
+
+    def save_context(self, context):
+        self.__save("INSERT OR REPLACE INTO context (id, title) VALUES (?, ?)",
+                    (str(context.id), context.title))
+
+    def save_realm(self, realm):
+        self.__save("INSERT OR REPLACE INTO realm (id, title) VALUES (?, ?)",
+                    (str(realm.id), realm.title))
+
+    def save_area(self, area):
+        rec = object_record(area)
+        self.__save("INSERT OR REPLACE INTO area (id, title, realm) VALUES (?, ?, ?)",
+                    (str(area.id), area.title, _id_str(rec["realm"])))
+
+    def save_project(self, project):
+        rec = object_record(project)
+        self.__save("INSERT OR REPLACE INTO project (id, title, notes, start_date, "
+                    "due_date, complete, area) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (str(project.id), project.title, project.notes,
+                     _date_str(project.start_date), _date_str(project.due_date),
+                     _date_str(project.complete), _id_str(rec["area"])))
+
+    def save_task(self, task):
+        rec = object_record(task)
+        id_str = str(task.id)
+        self.__lock.acquire()
+        try:
+            self.__db.execute("DELETE FROM task_context WHERE task = ?", (id_str,))
+            self.__db.executemany("INSERT INTO task_context (task, context) VALUES (?, ?)",
+                                  [(id_str, str(c)) for c in rec["contexts"]])
+            self.__save("INSERT OR REPLACE INTO task (id, title, notes, start_date, "
+                        "due_date, complete, project) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (id_str, task.title, task.notes,
+                         _date_str(task.start_date), _date_str(task.due_date),
+                         _date_str(task.complete), _id_str(rec["project"])))
+        finally:
+            self.__lock.release()
+
+    def delete_object(self, obj):
+        table = object_type(obj)
+        id_str = str(obj.id)
+        self.__lock.acquire()
+        try:
+            if table == "task":
+                self.__db.execute("DELETE FROM task_context WHERE task = ?", (id_str,))
+            elif table == "context":
+                self.__db.execute("DELETE FROM task_context WHERE context = ?", (id_str,))
+            self.__db.execute("DELETE FROM %s WHERE id = ?" % (table), (id_str,))
+            self.__commit()
+        finally:
+            self.__lock.release()
+
+    def close(self):
+        self.__lock.acquire()
+        try:
+            if self.__db:
+                # anything left of an unfinished batch
+                self.__db.commit()
+                self.__db.close()
+                self.__db = None
+        finally:
+            self.__lock.release()
+
+    def __select(self, sql, args):
+        '''Return the rows sql selects.'''
+        self.__lock.acquire()
+        try:
+            return self.__db.execute(sql, args).fetchall()
+        finally:
+            self.__lock.release()
+
+    ##### Queries #####
+    # Each query takes an optional list of realms to restrict the results to,
+    # defaulting to the visible realms.  Results are lists of live gtd objects.
+
+    def __realm_clause(self, realms):
+        if realms is None:
+            realms = [r for r in GTD().realms if r.visible]
+        ids = [str(r.id) for r in realms if not isinstance(r, gtd.RealmNone)]
+        clause = "a.realm IN (%s)" % (", ".join(["?"] * len(ids)))
+        for r in realms:
+            if isinstance(r, gtd.RealmNone):
+                clause = "(%s OR a.realm IS NULL)" % (clause)
+                break
+        return clause, ids
+
+    def __query_tasks(self, where, args, realms):
+        realm_clause, realm_args = self.__realm_clause(realms)
+        sql = "SELECT t.id FROM task t LEFT JOIN project p ON t.project = p.id " \
+              "LEFT JOIN area a ON p.area = a.id WHERE %s AND %s" % (where, realm_clause)
+        tasks = []
+        for (id,) in self.__select(sql, tuple(args) + tuple(realm_args)):
+            obj = GTD().lookup(_str_id(id))
+            if obj:
+                tasks.append(obj)
+            else:
+                warning("task %s is stored but not in the tree" % (id))
+        return tasks
+
+    def open_tasks_due_before(self, date, realms=None):
+        '''Return the incomplete tasks due before date.'''
+        return self.__query_tasks("t.complete IS NULL AND t.due_date < ?",
+                                  [_date_str(date)], realms)
+
+    def open_tasks_starting_before(self, date, realms=None):
+        '''Return the incomplete tasks with a start date before date.'''
+        return self.__query_tasks("t.complete IS NULL AND t.start_date < ?",
+                                  [_date_str(date)], realms)
+
+    def tasks_completed_since(self, date, realms=None):
+        '''Return the tasks completed on or after date.'''
+        return self.__query_tasks("t.complete >= ?", [_date_str(date)], realms)
+
+    def context_tasks(self, context, realms=None):
+        '''Return the tasks with the given context.'''
+        realm_clause, realm_args = self.__realm_clause(realms)
+        sql = "SELECT t.id FROM task_context tc JOIN task t ON tc.task = t.id " \
+              "LEFT JOIN project p ON t.project = p.id " \
+              "LEFT JOIN area a ON p.area = a.id WHERE tc.context = ? AND %s" % (realm_clause)
+        tasks = [GTD().lookup(_str_id(id)) for (id,) in
+                 self.__select(sql, (str(context.id),) + tuple(realm_args))]
+        return [t for t in tasks if t]
@@ -0,0 +1,68 @@
+#    Filename: wal.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: write-ahead log making a batch of file operations all or nothing
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-May-23:  Initial version by Darren Hart <darren@dvhart.com>
+
+import os, os.path
+import cPickle as pickle
+from logging import debug, info, warning, error, critical
+
+WAL_NAME = "braindump.wal"
+
+class WriteAheadLog(object):
+    '''A redo log holding at most one batch, logged before it is carried out
+    and cleared once it has been.'''
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def log(self, record, sync=True):
+        '''Record the batch about to be carried out, replacing any earlier one.'''
+        fd = open(self.filename, "wb")
+        try:
+            pickle.dump(record, fd, pickle.HIGHEST_PROTOCOL)
+            if sync:
+                fd.flush()
+                os.fsync(fd.fileno())
+        finally:
+            fd.close()
+
+    def clear(self):
+        '''Mark the logged batch as done.'''
+        # An unsynced clear may be lost in a crash, replaying the batch again
+        # must then be harmless
+        open(self.filename, "wb").close()
+
+    def pending(self):
+        '''Return the record of an interrupted batch, or None.'''
+        try:
+            if os.path.getsize(self.filename) == 0:
+                return None
+        except OSError:
+            return None
+        fd = open(self.filename, "rb")
+        try:
+            try:
+                return pickle.load(fd)
+            except:
+                warning("discarding incomplete write-ahead log entry: %s" % (self.filename))
+                return None
+        finally:
+            fd.close()
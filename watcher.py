@@ -0,0 +1,205 @@
+#    Filename: watcher.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: watch the data directory for changes made by other processes
+#              (or sync tools) and merge them into the GTD tree
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-May-16:  Initial version by Darren Hart <darren@dvhart.com>
+
+import os
+import errno
+import fnmatch
+import struct
+import gobject
+from xmlstore import SHARD_PATTERN
+from logging import debug, info, warning, error, critical
+
+# inotify is Linux only, and reached through ctypes (new in python 2.5)
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _libc.inotify_init
+    _libc.inotify_add_watch
+except (ImportError, OSError, AttributeError, TypeError):
+    _libc = None
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+_IN_EVENT = struct.Struct("iIII") # wd, mask, cookie, len (then the name)
+_IN_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_CREATE
+
+# Milliseconds to wait after the last event before refreshing, so a burst of
+# events (a sync rewriting many files) is merged in one go
+DEFAULT_DELAY = 500
+
+# Seconds between scans of the directory when inotify isn't available
+DEFAULT_POLL_INTERVAL = 10
+
+class DirectoryWatcher(object):
+    '''Merge changes made by others to the store's files (and those of its
+    shards) into the GTD() tree, delay ms after the last one.  queue, the
+    store's WriteBehind if any, is flushed before each refresh.'''
+
+    def __init__(self, store, path, queue=None, pattern="*.xml", delay=DEFAULT_DELAY,
+                 poll_interval=DEFAULT_POLL_INTERVAL, subdirs=SHARD_PATTERN):
+        self.__store = store
+        self.__path = path
+        self.__queue = queue
+        self.__pattern = pattern
+        self.__subdirs = subdirs
+        self.__delay = delay
+        self.__poll_interval = poll_interval
+        self.__fd = None
+        self.__watches = {}   # watch descriptor -> subdirectory ("" for path)
+        self.__sources = []
+        self.__timeout = None
+        self.__names = set()  # changed names since the last refresh
+        self.__rescan = False # refresh everything, events were lost
+
+    def start(self):
+        self.stop()
+        self.__fd = self.__inotify()
+        if self.__fd is None:
+            self.__poll()
+        else:
+            debug("watching %s with inotify" % (self.__path))
+            self.__sources.append(gobject.io_add_watch(self.__fd, gobject.IO_IN,
+                                                       self.__on_inotify))
+
+    def stop(self):
+        for source in self.__sources:
+            gobject.source_remove(source)
+        self.__sources = []
+        if self.__timeout:
+            gobject.source_remove(self.__timeout)
+            self.__timeout = None
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+        self.__watches = {}
+
+    def __poll(self):
+        info("polling %s for changes every %d s" % (self.__path, self.__poll_interval))
+        self.__sources.append(gobject.timeout_add(self.__poll_interval * 1000,
+                                                  self.__on_poll))
+
+    def polling(self):
+        '''Return True if the directory is polled rather than watched.'''
+        return self.__fd is None
+
+    def __inotify(self):
+        if _libc is None:
+            return None
+        fd = _libc.inotify_init()
+        if fd < 0:
+            warning("inotify_init failed: %s" % (os.strerror(ctypes.get_errno())))
+            return None
+        self.__watches = {}
+        if not self.__add_watch(fd, ""):
+            os.close(fd)
+            return None
+        for name in os.listdir(self.__path):
+            if fnmatch.fnmatch(name, self.__subdirs) and \
+               os.path.isdir(os.path.join(self.__path, name)):
+                self.__add_watch(fd, name)
+        return fd
+
+    def __add_watch(self, fd, subdir):
+        dir = os.path.join(self.__path, subdir)
+        wd = _libc.inotify_add_watch(fd, dir, _IN_MASK)
+        if wd < 0:
+            warning("unable to watch %s: %s" % (dir, os.strerror(ctypes.get_errno())))
+            return False
+        self.__watches[wd] = subdir
+        return True
+
+    def __on_inotify(self, fd, condition):
+        try:
+            data = os.read(fd, 64 * 1024)
+        except OSError, e:
+            if e.errno in [errno.EINTR, errno.EAGAIN]:
+                return True
+            raise
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _IN_EVENT.unpack_from(data, offset)
+            offset = offset + _IN_EVENT.size
+            name = data[offset:offset + length].rstrip("\0")
+            offset = offset + length
+            if mask & IN_Q_OVERFLOW:
+                warning("inotify queue overflowed, rescanning %s" % (self.__path))
+                self.__rescan = True
+            elif mask & IN_IGNORED:
+                subdir = self.__watches.pop(wd, None)
+                if subdir == "":
+                    # the directory was moved or unmounted, or its watch
+                    # dropped, inotify has nothing more to tell us
+                    warning("%s is no longer watched, polling it instead" % (self.__path))
+                    self.stop()
+                    self.__poll()
+                    return False
+            elif mask & IN_ISDIR:
+                if mask & IN_CREATE and self.__watches.get(wd, None) == "" and \
+                   fnmatch.fnmatch(name, self.__subdirs):
+                    # a new shard, files may have landed in it before the watch
+                    self.__add_watch(fd, name)
+                    self.__rescan = True
+            elif fnmatch.fnmatch(name, self.__pattern) and wd in self.__watches:
+                self.__names.add(os.path.join(self.__watches[wd], name))
+        self.__schedule()
+        return True
+
+    def __on_poll(self):
+        self.__rescan = True
+        self.__refresh()
+        return True
+
+    def __schedule(self):
+        # restart the delay on every event, refreshing once the burst is over
+        if self.__timeout:
+            gobject.source_remove(self.__timeout)
+        self.__timeout = gobject.timeout_add(self.__delay, self.__on_timeout)
+
+    def __on_timeout(self):
+        self.__timeout = None
+        self.__refresh()
+        return False
+
+    def __refresh(self):
+        names = list(self.__names)
+        rescan = self.__rescan
+        self.__names = set()
+        self.__rescan = False
+        if not names and not rescan:
+            return
+        if self.__queue:
+            self.__queue.flush()
+        if rescan:
+            count = self.__store.refresh()
+        else:
+            count = self.__store.refresh(names)
+        if count:
+            info("merged %d changed objects from %s" % (count, self.__path))
@@ -0,0 +1,183 @@
+#    Filename: writebehind.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: coalescing write-behind queue between the GTD tree and a
+#              backing store
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-May-02:  Initial version by Darren Hart <darren@dvhart.com>
+
+import sys
+import time
+import threading
+from backend import ChangeListener
+from logging import debug, info, warning, error, critical
+
+# Seconds to wait after the first queued change before writing, giving
+# further changes to the same objects time to coalesce
+DEFAULT_DELAY = 0.5
+
+class WriteBehind(ChangeListener):
+    '''Save gtd objects to a backing store from a worker thread, delay seconds
+    after they change.  Repeated changes to an object are written once, with
+    the object's state at the time.'''
+
+    def __init__(self, store, delay=DEFAULT_DELAY):
+        self.__store = store
+        self.__delay = delay
+        self.__cond = threading.Condition()
+        self.__write_lock = threading.Lock() # held while writing a batch
+        self.__pending = {}    # obj.id -> (op, obj)
+        self.__order = []      # obj.id in the order first queued
+        self.__committing = [] # (op, obj) queued during a transaction commit
+        self.__stopping = False
+
+        # metrics, see stats()
+        self.__queued = 0
+        self.__coalesced = 0
+        self.__max_depth = 0
+        self.__flushes = 0
+        self.__written = 0
+        self.__last_latency = 0.0
+        self.__max_latency = 0.0
+        self.__total_latency = 0.0
+
+        self.__worker = threading.Thread(target=self.__run, name="WriteBehind")
+        self.__worker.setDaemon(True)
+        self.__worker.start()
+
+    # Changes the store applied itself (see XMLStore.refresh) are already saved
+    def _change_origin(self):
+        return self.__store
+
+    def _changed(self, tree, op, obj):
+        # a transaction is queued all at once, so it isn't written in pieces
+        if tree.committing:
+            self.__committing.append((op, obj))
+        else:
+            self.__queue([(op, obj)])
+
+    def _committed(self, tree):
+        ops = self.__committing
+        self.__committing = []
+        self.__queue(ops)
+
+    def __queue(self, ops):
+        self.__cond.acquire()
+        try:
+            was_empty = not self.__pending
+            for op, obj in ops:
+                self.__queued = self.__queued + 1
+                if obj.id in self.__pending:
+                    self.__coalesced = self.__coalesced + 1
+                else:
+                    self.__order.append(obj.id)
+                self.__pending[obj.id] = (op, obj)
+            self.__max_depth = max(self.__max_depth, len(self.__pending))
+            if was_empty and self.__pending:
+                self.__cond.notify()
+        finally:
+            self.__cond.release()
+
+    def __run(self):
+        while True:
+            self.__cond.acquire()
+            try:
+                while not self.__pending and not self.__stopping:
+                    self.__cond.wait()
+                if self.__stopping:
+                    return
+                # let more changes coalesce before writing
+                self.__cond.wait(self.__delay)
+            finally:
+                self.__cond.release()
+            self.__write_pending()
+
+    def __write_pending(self):
+        # Take the batch with the write lock held so batches are always
+        # written in the order they were taken
+        self.__write_lock.acquire()
+        try:
+            self.__cond.acquire()
+            try:
+                batch = [self.__pending[id] for id in self.__order]
+                self.__pending = {}
+                self.__order = []
+            finally:
+                self.__cond.release()
+            if not batch:
+                return
+
+            start = time.time()
+            batched = hasattr(self.__store, "begin_batch")
+            if batched:
+                self.__store.begin_batch()
+            try:
+                for op, obj in batch:
+                    try:
+                        if op == "save":
+                            self.__store.save_object(obj)
+                        else:
+                            self.__store.delete_object(obj)
+                    except:
+                        e = sys.exc_info()[1]
+                        error("Unhandled exception: %s while trying to %s %s" % (e, op, obj.id))
+            finally:
+                if batched:
+                    self.__store.commit_batch()
+            latency = time.time() - start
+
+            self.__flushes = self.__flushes + 1
+            self.__written = self.__written + len(batch)
+            self.__last_latency = latency
+            self.__max_latency = max(self.__max_latency, latency)
+            self.__total_latency = self.__total_latency + latency
+            debug("wrote %d objects in %.3f s" % (len(batch), latency))
+        finally:
+            self.__write_lock.release()
+
+    def flush(self):
+        '''Write everything queued, returns once it is written.'''
+        self.__write_pending()
+
+    def close(self):
+        '''Flush and stop the worker thread.'''
+        self.__cond.acquire()
+        self.__stopping = True
+        self.__cond.notify()
+        self.__cond.release()
+        self.__worker.join()
+        self.flush()
+
+    def depth(self):
+        '''Return the number of objects waiting to be written.'''
+        return len(self.__pending)
+
+    def stats(self):
+        '''Return a dict of queue depth and flush latency metrics.'''
+        avg = 0.0
+        if self.__flushes:
+            avg = self.__total_latency / self.__flushes
+        return {"depth":len(self.__pending),
+                "max_depth":self.__max_depth,
+                "queued":self.__queued,
+                "coalesced":self.__coalesced,
+                "flushes":self.__flushes,
+                "written":self.__written,
+                "last_flush_latency":self.__last_latency,
+                "avg_flush_latency":avg,
+                "max_flush_latency":self.__max_latency}
@@ -1,341 +1,929 @@
+from __future__ import with_statement
 import os, os.path
 #import stat
 import fnmatch
-from xml.sax import saxutils, make_parser, handler
-from xml.sax._exceptions import *
+import shutil
+import cPickle as pickle
+from xml.parsers import expat
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import gtd
 from gtd import GTD
+from records import *
+from snapshot import *
+from wal import *
+from archive import *
+from xmlwriter import *
+from backend import *
 from logging import debug, info, warning, error, critical
 import sys
 
+# multiprocessing is new in python 2.6, without it we always load serially
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
 # FIXME: should we make the dates TZ aware ?
 # http://docs.python.org/lib/datetime-datetime.html
 _DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+# Parallel loads hand each worker process this many files at a time, and
+# directories with fewer files than this are not worth starting a pool for.
+_LOAD_CHUNK = 256
+
+# Patch the snapshot when no more than this fraction of the files changed
+# since it was written, otherwise parse everything.
+_SNAPSHOT_PATCH_LIMIT = 0.25
+
+# Durability policies, how hard a save tries to reach the disk before returning.
+# Every file is written to a temporary file and renamed into place, so a crash
+# never leaves a truncated file whatever the policy.
+DURABILITY_NONE = "none"   # leave it to the OS to write the files back
+DURABILITY_BATCH = "batch" # fsync the files of a batch, then the directory once
+DURABILITY_WRITE = "write" # fsync each file and the directory on every save
+
+_TMP_SUFFIX = ".tmp"
+
+# Directory layouts.  Flat directories hold every file directly in path,
+# sharded directories spread them over subdirectories named for the first two
+# hex digits of the object id (path/3f/3f2504e0-...xml), keeping each one small
+# however large the store grows.
+LAYOUT_FLAT = "flat"
+LAYOUT_SHARDED = "sharded"
+SHARD_PATTERN = "[0-9a-f][0-9a-f]"
+
 # FIXME: I think in the end, we should eliminate the singleton GTD()
 # and just return a gtd tree from here...
-class XMLStore(object):
-
-    def __init__(self):
+class XMLStore(Backend):
+    '''Store every gtd object in a file of its own, <id>.xml, in a directory.
+    A batch is renamed into place together, through a write-ahead log when it
+    holds more than one file.'''
+
+    def __init__(self, durability=DURABILITY_BATCH, layout=LAYOUT_FLAT, lazy_notes=False,
+                 dates=DATES_TEXT, jobs=1):
+        Backend.__init__(self)
         self.__path = None
+        if not durability in [DURABILITY_NONE, DURABILITY_BATCH, DURABILITY_WRITE]:
+            warning("unknown durability policy: %s, using %s" % (durability, DURABILITY_BATCH))
+            durability = DURABILITY_BATCH
+        self.__durability = durability
+        if not layout in [LAYOUT_FLAT, LAYOUT_SHARDED]:
+            warning("unknown layout: %s, using %s" % (layout, LAYOUT_FLAT))
+            layout = LAYOUT_FLAT
+        self.__layout = layout
+        self.__sharded = False
+        self.__lazy_notes = lazy_notes
+        if not dates in [DATES_TEXT, DATES_EPOCH]:
+            warning("unknown date format: %s, using %s" % (dates, DATES_TEXT))
+            dates = DATES_TEXT
+        self.__dates = dates
+        self.__jobs = jobs
+        self.__batch_depth = 0
+        self.__batch = {}     # name -> digest of the temporary file awaiting rename
+        self.__deletes = set() # names awaiting delete
+        self.__forgets = set() # ids of deleted objects to drop from the archive
+        self.__wal = None
+        self.__archive = None
+        self.__paged = set()  # ids paged in from the archive
+        self.__manifest = {}  # name -> (size, mtime, digest), see snapshot.py
+        self.__failed = {}    # name -> (size, mtime) of files that couldn't be parsed
+        self.__dirty = False  # a file was written or deleted since the last snapshot
+        self.__writes = 0     # files written, see stats()
+        self.__skipped = 0    # saves skipped, the file already had the same contents
+
+    def _obj_name(self, id):
+        '''Return the name, relative to path, of the file for the object id.'''
+        id_str = str(id)
+        if self.__sharded:
+            return os.path.join(id_str[:2], id_str + ".xml")
+        return id_str + ".xml"
 
     def _obj_filename(self, obj):
-        return os.path.join(self.__path, str(obj.id) + ".xml")
-
-    def _simple_element(self, x, name, attrs, chars=None):
-        x.startElement(name, attrs)
-        if (chars):
-            x.characters(chars)
-        x.endElement(name)
-        x.characters("\n") # FIXME: what is the portable way to do this?
-
-    # FIXME: this is now of dubious utility (only context and realm can use it..., and probably
-    # shouldn't in favor of a more consistent xml file format (<title>...) in every object...
-    def _save_simple_element(self, name, obj):
-        id_str = str(obj.id)
-        fd = open(self._obj_filename(obj), "w")
+        return os.path.join(self.__path, self._obj_name(obj.id))
+
+    def __write(self, obj, data):
+        # Many modified signals don't change anything that is stored (the
+        # details pane reassigns identical notes on every cursor move), only
+        # write the file if its contents would change.
+        name = self._obj_name(obj.id)
+        filename = os.path.join(self.__path, name)
+        digest = content_digest(data)
+        if name in self.__deletes:
+            # deleted earlier in the batch, the file must be written again
+            self.__deletes.discard(name)
+            written = None
+        elif name in self.__batch:
+            written = self.__batch[name]
+        else:
+            entry = self.__manifest.get(name, None)
+            written = entry and os.path.exists(filename) and entry[2]
+        if written == digest:
+            self.__skipped = self.__skipped + 1
+            return
+
+        if self.__sharded and not os.path.isdir(os.path.dirname(filename)):
+            os.mkdir(os.path.dirname(filename))
+            if self.__durability != DURABILITY_NONE:
+                self.__sync_dirs([os.path.dirname(name)]) # the new shard's entry in path
+        fd = open(filename + _TMP_SUFFIX, "wb")
         try:
-            x = saxutils.XMLGenerator(fd)
-            x.startDocument()
-            self._simple_element(x, name, {"id":id_str}, obj.title)
-            x.endDocument()
+            fd.write(data)
+            if self.__durability == DURABILITY_WRITE:
+                fd.flush()
+                os.fsync(fd.fileno())
         finally:
             fd.close()
-
-    def connect(self, tree):
-        # new signals
-        tree.connect("context_added", lambda t,o: self.save_context(o))
-        tree.connect("task_added", lambda t,o: self.save_task(o))
-        tree.connect("project_added", lambda t,o: self.save_project(o))
-        tree.connect("area_added", lambda t,o: self.save_area(o))
-        tree.connect("realm_added", lambda t,o: self.save_realm(o))
-
-        # modify signals
-        tree.connect("context_modified", lambda t,o: self.save_context(o))
-        tree.connect("task_modified", lambda t,o: self.save_task(o))
-        tree.connect("project_modified", lambda t,o: self.save_project(o))
-        tree.connect("area_modified", lambda t,o: self.save_area(o))
-        tree.connect("realm_modified", lambda t,o: self.save_realm(o))
-
-        # remove signals
-        tree.connect("context_removed", lambda t,o: self.delete_object(o))
-        tree.connect("task_removed", lambda t,o: self.delete_object(o))
-        tree.connect("project_removed", lambda t,o: self.delete_object(o))
-        tree.connect("area_removed", lambda t,o: self.delete_object(o))
-        tree.connect("realm_removed", lambda t,o: self.delete_object(o))
-
-    def load(self, path):
+        self.__writes = self.__writes + 1
+        self.__batch[name] = digest
+        if not self.__batch_depth:
+            self.__commit()
+
+    def __commit(self):
+        batch = self.__batch
+        deletes = self.__deletes
+        forgets = self.__forgets
+        self.__batch = {}
+        self.__deletes = set()
+        self.__forgets = set()
+        if not batch and not deletes and not forgets:
+            return
+        sync = self.__durability != DURABILITY_NONE
+        self.__archive.forget(list(forgets), sync)
+        if self.__durability == DURABILITY_BATCH:
+            for name in batch:
+                fd = open(os.path.join(self.__path, name) + _TMP_SUFFIX, "rb")
+                try:
+                    os.fsync(fd.fileno())
+                finally:
+                    fd.close()
+
+        # A single rename or unlink is atomic by itself, a larger batch is
+        # logged so it can be completed should we crash part way through
+        logged = len(batch) + len(deletes) > 1
+        if logged:
+            self.__wal.log({"saves":batch.items(), "deletes":list(deletes)}, sync)
+        for name, digest in batch.iteritems():
+            filename = os.path.join(self.__path, name)
+            os.rename(filename + _TMP_SUFFIX, filename)
+            # Recording what we wrote also lets refresh() tell our own writes
+            # apart from changes made by others
+            self.__manifest[name] = stat_entry(filename, digest)
+        for name in deletes:
+            filename = os.path.join(self.__path, name)
+            if os.path.exists(filename):
+                os.unlink(filename)
+            else:
+                warning("Couldn't delete %s" % (filename))
+            if name in self.__manifest:
+                del self.__manifest[name]
+        self.__dirty = True
+        if sync:
+            self.__sync_dirs(batch.keys() + list(deletes))
+        if logged:
+            self.__wal.clear()
+
+    def __recover(self):
+        # Complete the batch (see __commit) that was interrupted by a crash
+        rec = self.__wal.pending()
+        if rec:
+            info("completing an interrupted save: %d files, %d deletes" %
+                 (len(rec["saves"]), len(rec["deletes"])))
+            for name, digest in rec["saves"]:
+                filename = os.path.join(self.__path, name)
+                if not os.path.exists(filename + _TMP_SUFFIX):
+                    continue # renamed before the crash
+                fd = open(filename + _TMP_SUFFIX, "rb")
+                try:
+                    data = fd.read()
+                finally:
+                    fd.close()
+                if content_digest(data) == digest:
+                    os.rename(filename + _TMP_SUFFIX, filename)
+            for name in rec["deletes"]:
+                filename = os.path.join(self.__path, name)
+                if os.path.exists(filename):
+                    os.unlink(filename)
+            self.__sync_dirs([name for name, digest in rec["saves"]] + rec["deletes"])
+            self.__wal.clear()
+        elif os.path.exists(self.__wal.filename) and os.path.getsize(self.__wal.filename):
+            # never started, the temporary files are removed by load()
+            self.__wal.clear()
+
+    def __sync_dirs(self, names):
+        # fsync the directories holding the named files
+        dirs = set([os.path.dirname(os.path.join(self.__path, name)) for name in names])
+        for dir in dirs:
+            fd = os.open(dir, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def begin_batch(self):
+        self.__batch_depth = self.__batch_depth + 1
+
+    def commit_batch(self):
+        self.__batch_depth = self.__batch_depth - 1
+        if self.__batch_depth == 0:
+            self.__commit()
+
+    def stats(self):
+        '''Return a dict of the number of files written and of saves skipped.'''
+        return {"writes":self.__writes, "skipped":self.__skipped}
+
+    def close(self):
+        '''Write a snapshot for the next load to start from.'''
+        self.write_snapshot()
+
+    def load(self, path, jobs=None):
+        '''Load every object stored in path into the GTD() tree, from the
+        snapshot where the files haven't changed since it was written.  The
+        files are parsed by jobs worker processes, see _map().'''
         if path is None:
             critical("no path specified")
         elif not os.path.exists(path):
             critical("specified path does not exist: %s" % (path))
+        if jobs is None:
+            jobs = self.__jobs
         self.__path = path
-
-        ch = GTDContentHandler()
-        eh = GTDErrorHandler()
-        parser = make_parser()
-        parser.setFeature(handler.feature_namespaces, 0)
-        parser.setContentHandler(ch)
-        parser.setErrorHandler(eh)
-        #parser.setDTDHandler(?)
-        #parser.setEntityResolver(?)
-
-        # iterate on every xml file in "path"
-        for file in os.listdir(self.__path):
-            if fnmatch.fnmatch(file, '*.xml'):
-                debug("Loading GTD object from: %s" % (os.path.join(self.__path, file)))
+        self.__wal = WriteAheadLog(os.path.join(self.__path, WAL_NAME))
+        self.__archive = Archive(os.path.join(self.__path, ARCHIVE_DIR))
+        self.__recover()
+        # the snapshot may have been written with lazy notes
+        GTD().notes_loader = self.load_notes
+        self.__sharded = self.__layout == LAYOUT_SHARDED or len(_shard_dirs(self.__path)) > 0
+        if self.__sharded:
+            shard_directory(self.__path)
+        self.__manifest, tmps = self.__scan(jobs)
+        # left behind by a crash before they could be renamed into place
+        for name in tmps:
+            info("removing incomplete save: %s" % (name))
+            os.unlink(os.path.join(self.__path, name))
+
+        records = None
+        snap = read_snapshot(self._snapshot_filename())
+        if snap:
+            records = self.__patch_snapshot(snap[0], snap[1], jobs)
+        if records is None:
+            records = self.__parse_records(self.__manifest.keys(), jobs).values()
+            self.__dirty = True
+
+        builder = TreeBuilder()
+        builder.extend(records)
+        builder.build()
+
+    def __scan(self, jobs):
+        # the shards are scanned in parallel, see _parse()
+        dirs = [(self.__path, None)] + [(self.__path, d) for d in _shard_dirs(self.__path)]
+        manifest = {}
+        tmps = []
+        for m, t in _map(_scan_dir, dirs, jobs):
+            manifest.update(m)
+            tmps.extend(t)
+        return manifest, tmps
+
+    def _snapshot_filename(self):
+        return os.path.join(self.__path, SNAPSHOT_NAME)
+
+    def __patch_snapshot(self, manifest, records, jobs):
+        changed, removed = manifest_changes(manifest, self.__manifest)
+        if len(changed) + len(removed) > _SNAPSHOT_PATCH_LIMIT * len(self.__manifest):
+            info("snapshot is out of date, %d files changed, %d removed" %
+                 (len(changed), len(removed)))
+            return None
+
+        # keep the digests of the files that haven't changed
+        for name, entry in manifest.iteritems():
+            if name in self.__manifest and not name in changed:
+                self.__manifest[name] = entry
+        if not changed and not removed:
+            debug("loading %d objects from the snapshot" % (len(records)))
+            return records
+
+        debug("patching snapshot: %d files changed, %d removed" % (len(changed), len(removed)))
+        by_name = {}
+        for rec in records:
+            by_name[self._obj_name(rec["id"])] = rec
+        for name in removed:
+            if name in by_name:
+                del by_name[name]
+        by_name.update(self.__parse_records(changed, jobs))
+        self.__dirty = True
+        return by_name.values()
+
+    def __parse_records(self, names, jobs):
+        '''Parse the named files, return {name: record}.  Files that couldn't
+        be parsed are left out of the manifest and recorded in __failed.'''
+        by_name = {}
+        entries = {}
+        for name in names:
+            if name in self.__manifest:
+                entries[name] = self.__manifest.pop(name)
+        for name, entry, rec in self._parse(names, jobs, self.__lazy_notes):
+            self.__manifest[name] = entry
+            by_name[name] = rec
+        self.__failed = {}
+        for name, entry in entries.iteritems():
+            if not name in by_name:
+                self.__failed[name] = entry[:2]
+        return by_name
+
+    def _parse(self, names, jobs, lazy_notes=False):
+        '''Return (name, manifest entry, record) for each of the named files
+        that could be parsed, see load().'''
+        files = [(name, os.path.join(self.__path, name)) for name in names]
+        chunks = [(files[i:i+_LOAD_CHUNK], lazy_notes)
+                  for i in range(0, len(files), _LOAD_CHUNK)]
+        parsed = []
+        for p in _map(_parse_files, chunks, jobs):
+            parsed.extend(p)
+        return parsed
+
+    def refresh(self, names=None):
+        '''Merge the files in path (or just names) changed since they were
+        loaded into the GTD() tree in a single transaction, return the number
+        of objects added, modified, or removed.'''
+        if names is None:
+            scanned = self.__scan(1)[0]
+            changed, removed = manifest_changes(self.__manifest, scanned)
+            for name in self.__failed.keys():
+                if not name in scanned:
+                    del self.__failed[name]
+        else:
+            scanned = {}
+            removed = []
+            for name in names:
                 try:
-                    parser.parse(os.path.join(self.__path, file))
-                except SAXParseException, e:
-                    error("SAXParseException: %s" % (e))
-                    error("The file was not created (or saved) properly.  The "
-                          "most likely cause is a missing closing element tag, "
-                          "such as </task>.")
-                except:
-                    e = sys.exc_info()[1]
-                    error("Unhandled exception: %s" % (e))
-                
+                    scanned[name] = stat_entry(os.path.join(self.__path, name))
+                except OSError:
+                    self.__failed.pop(name, None)
+                    if name in self.__manifest:
+                        removed.append(name)
+            changed = [name for name, entry in scanned.iteritems()
+                       if not name in self.__manifest or
+                          self.__manifest[name][:2] != entry[:2]]
+        changed = [name for name in changed
+                   if self.__failed.get(name, None) != scanned[name][:2]]
+        if not changed and not removed:
+            return 0
+
+        records = []
+        parsed = set()
+        for name, entry, rec in self._parse(changed, 1):
+            parsed.add(name)
+            self.__failed.pop(name, None)
+            old = self.__manifest.get(name, None)
+            self.__manifest[name] = entry
+            if old and old[2] == entry[2]:
+                continue
+            records.append(rec)
+        for name in changed:
+            if not name in parsed:
+                self.__failed[name] = scanned[name][:2]
+
+        objects = tree_objects()
+        gone = []
+        for name in removed:
+            del self.__manifest[name]
+            obj = objects.get(uuid.UUID(os.path.basename(name)[:-len(".xml")]), None)
+            if obj:
+                gone.append(obj)
+        gone.sort(key=lambda o: BUILD_ORDER.index(object_type(o)), reverse=True)
+        debug("refresh: %d files changed, %d applied, %d removed" %
+              (len(changed), len(records), len(gone)))
+        if not records and not gone:
+            return 0
+
+        tree = GTD()
+        with tree.transaction(origin=self):
+            modified = [(objects[rec["id"]], rec) for rec in records if rec["id"] in objects]
+            builder = TreeBuilder(objects, bulk=False)
+            builder.extend([rec for rec in records if not rec["id"] in objects])
+            builder.build()
+            for obj, rec in modified:
+                apply_record(obj, rec, builder)
+            for obj in gone:
+                getattr(tree, "remove_" + object_type(obj))(obj)
+        self.__dirty = True
+        return len(records) + len(gone)
+
+    ##### Archive #####
+    # Tasks and projects completed long ago are moved to a compressed archive
+    # (see archive.py) which load() doesn't read.  They are paged back into
+    # the tree on request, and stay archived unless they are modified, when
+    # they are saved to a file like any other object.
+
+    def archive(self, days):
+        '''Move the tasks and projects completed more than days ago into the
+        archive, return how many.'''
+        cutoff = datetime.now() - timedelta(days=days)
+        def old(obj):
+            return obj.complete and obj.complete < cutoff and not obj.id in self.__paged
+
+        tasks = []
+        projects = []
+        for r in GTD().realms:
+            for a in r.areas:
+                for p in a.projects:
+                    old_tasks = [t for t in p.tasks if old(t)]
+                    tasks.extend(old_tasks)
+                    if not isinstance(p, gtd.BaseNone) and old(p) and \
+                       len(old_tasks) == len(p.tasks):
+                        projects.append(p)
+        if not tasks and not projects:
+            return 0
+        info("archiving %d tasks and %d projects completed before %s" %
+             (len(tasks), len(projects), cutoff))
+
+        # Archive first, should we crash before the files are deleted the
+        # files win (load_archive skips objects already in the tree)
+        self.__archive.add([object_record(o) for o in tasks + projects],
+                           self.__durability != DURABILITY_NONE)
+        tree = GTD()
+        with tree.transaction(origin=self):
+            for t in tasks:
+                tree.remove_task(t)
+            for p in projects:
+                tree.remove_project(p)
+        self.begin_batch()
+        try:
+            for o in tasks + projects:
+                self.__delete_file(self._obj_name(o.id))
+        finally:
+            self.commit_batch()
+        return len(tasks) + len(projects)
+
+    def load_archive(self, match=None):
+        '''Page the archived objects (those for which match(record) is True)
+        into the GTD() tree, return them.'''
+        archived = self.__archive.records()
+        objects = tree_objects()
+        records = [rec for rec in archived.itervalues() if not rec["id"] in objects]
+        if match:
+            records = [rec for rec in records if match(rec)]
+            ids = set([rec["id"] for rec in records])
+            for rec in list(records):
+                project = archived.get(rec.get("project", None), None)
+                if project and not project["id"] in objects and not project["id"] in ids:
+                    ids.add(project["id"])
+                    records.append(project)
+        if not records:
+            return []
+        debug("paging in %d archived objects" % (len(records)))
+
+        with GTD().transaction(origin=self):
+            builder = TreeBuilder(objects, bulk=False)
+            builder.extend(records)
+            builder.build()
+        self.__paged.update([rec["id"] for rec in records])
+        return [objects[rec["id"]] for rec in records]
+
+    def search_archive(self, text):
+        '''Page in the archived objects with text in their title or notes.'''
+        text = text.lower()
+        def match(rec):
+            return text in rec["title"].lower() or text in (rec.get("notes", None) or "").lower()
+        return self.load_archive(match)
+
+    def load_notes(self, obj):
+        '''Return the notes of obj read from its file (see GTD.load_notes).'''
+        name = self._obj_name(obj.id)
+        parsed = _parse_files(([(name, os.path.join(self.__path, name))], False))
+        if not parsed:
+            warning("unable to load the notes of %s" % (obj.id))
+            return ""
+        return parsed[0][2]["notes"]
+
+    def write_snapshot(self, force=False):
+        '''Write a snapshot of the GTD() tree for the next load() to start
+        from, if a file was written since the last one.'''
+        if not self.__dirty and not force:
+            return
+        debug("writing snapshot: %s" % (self._snapshot_filename()))
+        # objects paged in from the archive (and placeholders) have no file
+        records = [rec for rec in tree_records(self.__lazy_notes)
+                   if self._obj_name(rec["id"]) in self.__manifest]
+        write_snapshot(self._snapshot_filename(), dict(self.__manifest), records)
+        self.__dirty = False
 
     def save(self, gtd_tree):
         critical("not implemented")
 
+    def save_object(self, obj):
+        getattr(self, "save_" + obj.__class__.__name__.lower())(obj)
+
     def delete_object(self, obj):
-        filename = self._obj_filename(obj)
-        if os.path.exists(filename):
-            os.unlink(filename)
-        else:
-            warning("Couldn't delete %s" % (filename))
+        paged = obj.id in self.__paged
+        if isinstance(obj, (gtd.Task, gtd.Project)):
+            # An archived copy is left by paging the object in during any
+            # session, it would come back with the next load_archive()
+            self.__forgets.add(obj.id)
+            self.__paged.discard(obj.id)
+        self.__delete_file(self._obj_name(obj.id), paged)
+
+    def __delete_file(self, name, paged=False):
+        if name in self.__batch:
+            os.unlink(os.path.join(self.__path, name) + _TMP_SUFFIX)
+            del self.__batch[name]
+        if not paged or name in self.__manifest:
+            # (a paged in object that was never saved has no file)
+            self.__deletes.add(name)
+        if not self.__batch_depth:
+            self.__commit()
 
     def save_context(self, context):
-        self._save_simple_element("context", context)
+        self.__write(context, context_xml(context, self.__dates))
 
     def save_task(self, task):
-        global _DATE_FORMAT
         if not isinstance(task, gtd.Task):
             critical("task is a %s" % (task.__class__.__name__))
-        debug("saving task: title=%s id=%s" % (task.title, task.id))
-        id_str = str(task.id)
-
-        start_date_str = ""
-        due_date_str = ""
-        complete_str = ""
-        if task.start_date:
-            start_date_str = task.start_date.strftime(_DATE_FORMAT)
-        if task.due_date:
-            due_date_str = task.due_date.strftime(_DATE_FORMAT)
-        if task.complete:
-            complete_str = task.complete.strftime(_DATE_FORMAT)
-
-        fd = open(self._obj_filename(task), "w")
+        if not isinstance(task.project, (gtd.Project, gtd.ProjectNone)):
+            critical("task.project is a %s" % (task.project.__class__.__name__))
         try:
-            x = saxutils.XMLGenerator(fd)
-            x.startDocument()
-            x.startElement("task", {"id":id_str})
-            x.characters("\n")
-            self._simple_element(x, "title", {}, task.title)
-            self._simple_element(x, "notes", {}, task.notes)
-            self._simple_element(x, "start_date", {}, start_date_str)
-            self._simple_element(x, "due_date", {}, due_date_str)
-            debug("saving project")
-            if not isinstance(task.project, gtd.ProjectNone):
-                debug("task project is a %s" % (task.project.__class__.__name__))
-                debug("referencing project: title=%s id=%s" % (task.project.title, task.project.id))
-                if not isinstance(task.project, gtd.Project):
-                    critical("task.project is a %s" % (task.project.__class__.__name__))
-                self._simple_element(x, "project_ref", {"id":str(task.project.id)},
-                                     task.project.title)
-            debug("saving contexts")
-            for c in task.contexts:
-                if isinstance(c, gtd.ContextNone):
-                    error("ContextNone should not be stored in the task!")
-                    continue
-                debug("referencing context: %s" % (c.title))
-                self._simple_element(x, "context_ref", {"id":str(c.id)}, c.title)
-            self._simple_element(x, "complete", {}, complete_str)
-            x.endElement("task")
-            x.endDocument()
+            data = task_xml(task, self.__dates)
         except:
-                    e = sys.exc_info()[1]
-                    error("Unhandled exception: %s while trying to save %s" %
-                          (e, id_str))
-        finally:
-            fd.close()
+            e = sys.exc_info()[1]
+            error("Unhandled exception: %s while trying to save %s" % (e, task.id))
+            return
+        self.__write(task, data)
 
     def save_project(self, project):
-        debug("saving project: %s" % (project.title))
-        debug("project area: %s" % (project.area))
-        global _DATE_FORMAT
-        id_str = str(project.id)
-
-        start_date_str = ""
-        due_date_str = ""
-        complete_str = ""
-        if project.start_date:
-            start_date_str = project.start_date.strftime(_DATE_FORMAT)
-        if project.due_date:
-            due_date_str = project.due_date.strftime(_DATE_FORMAT)
-        if project.complete:
-            complete_str = project.complete.strftime(_DATE_FORMAT)
-
-        fd = open(self._obj_filename(project), "w")
-        try:
-            x = saxutils.XMLGenerator(fd)
-            x.startDocument()
-            x.startElement("project", {"id":id_str})
-            x.characters("\n")
-            self._simple_element(x, "title", {}, project.title)
-            self._simple_element(x, "notes", {}, project.notes)
-            self._simple_element(x, "start_date", {}, start_date_str)
-            self._simple_element(x, "due_date", {}, due_date_str)
-            if not isinstance(project.area, gtd.AreaNone):
-                self._simple_element(x, "area_ref", {"id":str(project.area.id)},
-                                     project.area.title)
-            self._simple_element(x, "complete", {}, complete_str)
-            x.endElement("project")
-            x.endDocument()
-        finally:
-            fd.close()
+        self.__write(project, project_xml(project, self.__dates))
 
     def save_area(self, area):
-        id_str = str(area.id)
-        fd = open(self._obj_filename(area), "w")
-        try:
-            x = saxutils.XMLGenerator(fd)
-            x.startDocument()
-            x.startElement("area", {"id":id_str})
-            x.characters("\n")
-            self._simple_element(x, "title", {}, area.title)
-            self._simple_element(x, "realm_ref", {"id":str(area.realm.id)},
-                                 area.realm.title)
-            x.endElement("area")
-            x.endDocument()
-        finally:
-            fd.close()
+        self.__write(area, area_xml(area, self.__dates))
 
     def save_realm(self, realm):
-        self._save_simple_element("realm", realm)
-
-
-# ContentHandler, DTDHandler, EntityResolver, and ErrorHandler
-# consider HandlerBase ?
-class GTDContentHandler(handler.ContentHandler):
-
-    def __init__(self):
-        self.__chars = ""     # the CDATA the parser has collected
-        self.__subject = None # the object we are currently building
-        self.__cache = {}     # a dict of objects we have seen referenced in the file and constructed
-
-    def startElement(self, name, attrs):
-        debug("Start element: %s" % (name))
-
-        obj = None
-        cached = False
-        self.__chars = ""
-        id = None
-        id_str = attrs.get("id", None)
-        if id_str:
-            debug("ID_STR: %s" % (id_str))
-            id = uuid.UUID(id_str)
-
-        if id in self.__cache:
-            debug("found %s in cache." % (id))
-            cached = True
-            obj = self.__cache[id]
-        elif id: # if it doesn't have an id, it isn't a Primary object
-            debug("%s not in cache, generating." % (id))
-            # Primary objects: task, project, area, realm, and context
-            # Set the __subject object when first encountered
+        self.__write(realm, realm_xml(realm, self.__dates))
+
+
+# The record field set by each reference element
+_REF_FIELDS = {"project_ref":"project", "area_ref":"area", "realm_ref":"realm"}
+
+class GTDRecordParser(object):
+    '''Parse object files of any FORMAT_VERSION into records, without
+    touching the GTD() tree.'''
+
+    def __init__(self, lazy_notes=False):
+        self.record = None
+        self.__chars = []
+        self.__lazy_notes = lazy_notes
+        self.__skip = False
+        self.__names = {} # expat's intern dict
+        self.__start = {"notes":self.__start_notes,
+                        "context_ref":self.__start_context_ref}
+        self.__end = {"title":self.__end_title, "notes":self.__end_notes}
+        for name in ["task", "project", "area", "realm", "context"]:
+            self.__start[name] = self.__start_object
+        for name in _REF_FIELDS:
+            self.__start[name] = self.__start_ref
+        for name in ["realm", "context"]:
+            self.__end[name] = self.__end_title
+        for name in ["start_date", "due_date", "complete"]:
+            self.__end[name] = self.__end_date
+
+    def parse(self, data):
+        '''Return the record described by the document data, raises
+        expat.ExpatError if it isn't well formed.'''
+        self.record = None
+        self.__chars = []
+        self.__skip = False
+        parser = expat.ParserCreate(None, None, self.__names)
+        parser.buffer_text = True
+        parser.StartElementHandler = self.__on_start
+        parser.EndElementHandler = self.__on_end
+        parser.CharacterDataHandler = self.__on_chars
+        parser.Parse(data, True)
+        return self.record
+
+    def __on_start(self, name, attrs):
+        self.__chars = []
+        start = self.__start.get(name, None)
+        if start:
+            start(name, attrs)
+
+    def __on_end(self, name):
+        end = self.__end.get(name, None)
+        if end:
+            end(name, ' '.join(''.join(self.__chars).split()))
+        self.__chars = []
+
+    def __on_chars(self, content):
+        if self.record and not self.__skip:
+            self.__chars.append(content)
+
+    def __start_object(self, name, attrs):
+        version = int(attrs.get("version", 1))
+        if version > FORMAT_VERSION:
+            raise ValueError("format version %d is newer than %d" %
+                             (version, FORMAT_VERSION))
+        self.record = {"type":name, "id":uuid.UUID(attrs["id"]), "title":""}
+        if name in ["task", "project"]:
+            self.record.update({"notes":"", "start_date":None, "due_date":None,
+                                "complete":None})
             if name == "task":
-                obj = gtd.Task.create(id)
-            elif name == "project":
-                obj = gtd.Project.create(id)
-            elif name == "area":
-                obj = gtd.Area.create(id)
-            elif name == "realm":
-                obj = gtd.Realm.create(id)
-            elif name == "context":
-                obj = gtd.Context.create(id)
-
-        # Reference objects: fetch or build them, then assign to the __subject
-        if name == "context_ref":
-            if not cached:
-                obj = gtd.Context.create(id)
-            self.__subject.add_context(obj)
-        elif name == "project_ref":
-            if not cached:
-                obj = gtd.Project.create(id)
-            self.__subject.project.remove_task(self.__subject)
-            self.__subject.project = obj
-            obj.add_task(self.__subject)
-        elif name == "area_ref":
-            if not cached:
-                obj = gtd.Area.create(id)
-            self.__subject.area.remove_project(self.__subject)
-            self.__subject.area = obj
-            obj.add_project(self.__subject)
-        elif name == "realm_ref":
-            if not cached:
-                obj = gtd.Realm.create(id)
-            self.__subject.realm.remove_area(self.__subject)
-            self.__subject.realm = obj
-            obj.add_area(self.__subject)
-
-        # Elements we do nothing with on startElement
-        # notes
-        # start_date
-        # due_date
-        # complete
-
-        # FIXME: yulk! maybe we don't event *_ref, they might be just fine using
-        # <context id="sdsadada"/> inside subject elements...
-        if not cached and name in ["task", "project", "area", "realm", "context", "project_ref", "area_ref", "realm_ref", "context_ref"]:
-            debug("adding %s %s to cache" % (name, id))
-            self.__cache[id] = obj
-
-        if name in ["task", "project", "area", "realm", "context"]:
-            debug("setting subject to" % (id))
-            self.__subject = obj
-
-
-    def endElement(self, name):
-        global _DATE_FORMAT
-        debug("End element: %s" % (name))
-        chars = ' '.join(self.__chars.split())
-        self.__chars = ""
-
-        if name in ["task", "project", "area"]:
-            self.__subject = None
-        elif name in ["realm", "context"]: # hrm... perhaps these should just have a <title> tag anyway..
-            self.__subject.title = chars
-            self.__subject = None
-        elif name == "title":
-            self.__subject.title = chars
-        elif name == "notes":
-            self.__subject.notes = chars
-        elif name == "start_date":
-            if chars:
-                self.__subject.start_date = datetime.strptime(chars, _DATE_FORMAT)
-        elif name == "due_date":
-            if chars:
-                self.__subject.due_date = datetime.strptime(chars, _DATE_FORMAT)
-        elif name == "complete":
-            complete = None
-            if chars:
-                complete = datetime.strptime(chars, _DATE_FORMAT)
-            self.__subject.complete = complete
-
-        # Elements we do nothing with on endElement
-        # *_ref
-
-    def characters(self, content):
-        if self.__subject:
-            self.__chars = self.__chars + content
-
-class GTDErrorHandler(handler.ErrorHandler):
-    def __init__(self):
-        pass
-
-    def error(self, exception):
-        error("\%s\n" % (exception))
+                self.record.update({"project":None, "contexts":[]})
+            else:
+                self.record["area"] = None
+        elif name == "area":
+            self.record["realm"] = None
+
+    def __start_notes(self, name, attrs):
+        if self.__lazy_notes:
+            self.record["notes"] = None
+            self.__skip = True
+
+    def __start_context_ref(self, name, attrs):
+        self.record["contexts"].append(uuid.UUID(attrs["id"]))
+
+    def __start_ref(self, name, attrs):
+        self.record[_REF_FIELDS[name]] = uuid.UUID(attrs["id"])
+
+    def __end_title(self, name, chars):
+        self.record["title"] = chars
+
+    def __end_notes(self, name, chars):
+        if self.__skip:
+            self.__skip = False
+        else:
+            self.record["notes"] = chars
+
+    def __end_date(self, name, chars):
+        if chars:
+            self.record[name] = parse_date(chars)
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+# day ("%Y-%m-%d") -> (year, month, day), shared by the many tasks of a day
+_day_cache = {}
+_DAY_CACHE_SIZE = 4096
+
+def parse_date(s):
+    '''Return the datetime of a date written in either of the DATES_*
+    formats, raises ValueError if it is neither.'''
+    if len(s) == 19 and s[4] == "-" and s[10] == " " and s[13] == ":":
+        # _DATE_FORMAT is fixed width, strptime is far slower than slicing it
+        day = _day_cache.get(s[:10], None)
+        if day is None:
+            if s[7] != "-":
+                raise ValueError("invalid date: %s" % (s))
+            day = (int(s[:4]), int(s[5:7]), int(s[8:10]))
+            if len(_day_cache) >= _DAY_CACHE_SIZE:
+                _day_cache.clear()
+            _day_cache[s[:10]] = day
+        return datetime(day[0], day[1], day[2], int(s[11:13]), int(s[14:16]),
+                        int(s[17:19]))
+    if s.isdigit() or (s[:1] == "-" and s[1:].isdigit()):
+        return _EPOCH + timedelta(seconds=int(s))
+    return datetime.strptime(s, _DATE_FORMAT)
+
+def _map(func, items, jobs):
+    '''Return map(func, items), computed by a pool of jobs worker processes
+    (0 means one per cpu) where that is possible and worthwhile.'''
+    if multiprocessing is None or jobs == 1 or len(items) < 2:
+        return map(func, items)
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    debug("mapping %s over %d items with %d processes" % (func.__name__, len(items), jobs))
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+def _shard_dirs(path):
+    '''Return the names of the shard subdirectories of path.'''
+    return [name for name in os.listdir(path)
+            if fnmatch.fnmatch(name, SHARD_PATTERN) and
+               os.path.isdir(os.path.join(path, name))]
+
+def _scan_dir(args):
+    '''Return the manifest of the object files in a directory and the names
+    of the temporary files in it (a worker entry point), args is (path,
+    subdirectory or None).'''
+    path, subdir = args
+    found = scan_manifest(path, "*.xml*", subdir)
+    tmps = [name for name in found if fnmatch.fnmatch(name, "*.xml" + _TMP_SUFFIX)]
+    manifest = dict([(name, entry) for name, entry in found.iteritems()
+                     if fnmatch.fnmatch(name, "*.xml")])
+    return manifest, tmps
+
+def shard_directory(path):
+    '''Move the object files directly in path into their shard
+    subdirectories, return how many.'''
+    moved = 0
+    for name in os.listdir(path):
+        if not fnmatch.fnmatch(name, "*.xml"):
+            continue
+        shard = os.path.join(path, name[:2])
+        if not os.path.isdir(shard):
+            os.mkdir(shard)
+        os.rename(os.path.join(path, name), os.path.join(shard, name))
+        moved = moved + 1
+    if moved:
+        info("moved %d files of %s into shard directories" % (moved, path))
+    return moved
+
+def _parse_files(args):
+    '''Return a list of (name, manifest entry, record) parsed from files (a
+    worker entry point).  args is (files, lazy_notes), files is a list of
+    (name, filename), see GTDRecordParser for lazy_notes.'''
+    files, lazy_notes = args
+    parser = GTDRecordParser(lazy_notes)
+    recs = []
+    for name, filename in files:
+        debug("Loading GTD object from: %s" % (filename))
+        try:
+            entry = stat_entry(filename)
+            fd = open(filename, "rb")
+            try:
+                data = fd.read()
+            finally:
+                fd.close()
+            entry = entry[:2] + (content_digest(data),)
+            rec = parser.parse(data)
+        except expat.ExpatError, e:
+            error("ExpatError: %s in %s" % (e, filename))
+            error("The file was not created (or saved) properly.  The "
+                  "most likely cause is a missing closing element tag, "
+                  "such as </task>.")
+            continue
+        except:
+            e = sys.exc_info()[1]
+            error("Unhandled exception: %s in %s" % (e, filename))
+            continue
+        if rec:
+            recs.append((name, entry, rec))
+    return recs
+
+
+# Files replaced by migrate_format() are kept here until finish_migration()
+MIGRATE_BACKUP = "migrate-backup"
+# The digests of the files migrate_format() wrote, kept in MIGRATE_BACKUP
+_MIGRATE_DIGESTS = "digests"
+
+def _migrate_files(args):
+    '''Rewrite the named files (a worker entry point), return (files read,
+    files rewritten, [(name, digest)] of the migrated files, files that
+    couldn't be read).  args is (path, names, dates).'''
+    path, names, dates = args
+    parser = GTDRecordParser()
+    digests = []
+    migrated = failed = 0
+    for name in names:
+        filename = os.path.join(path, name)
+        try:
+            fd = open(filename, "rb")
+            try:
+                data = fd.read()
+            finally:
+                fd.close()
+            rec = parser.parse(data)
+        except:
+            e = sys.exc_info()[1]
+            error("unable to migrate %s: %s" % (filename, e))
+            failed = failed + 1
+            continue
+        if not rec:
+            continue
+        new = record_xml(rec, dates)
+        backup = os.path.join(path, MIGRATE_BACKUP, name)
+        if new == data:
+            if os.path.exists(backup):
+                # rewritten by an earlier, interrupted, run
+                digests.append((name, content_digest(new)))
+            continue
+        if not os.path.exists(backup):
+            # an earlier, interrupted, run may have saved the original already
+            os.link(filename, backup)
+        tmp = filename + _TMP_SUFFIX
+        fd = open(tmp, "wb")
+        try:
+            fd.write(new)
+            fd.flush()
+            os.fsync(fd.fileno())
+        finally:
+            fd.close()
+        os.rename(tmp, filename)
+        migrated = migrated + 1
+        digests.append((name, content_digest(new)))
+    return (len(names), migrated, digests, failed)
+
+def migrate_format(path, dates=DATES_TEXT, jobs=0, progress=None):
+    '''Rewrite every object file in path in the current FORMAT_VERSION, return
+    (files rewritten, files that couldn't be read), or None.  The originals
+    are kept until finish_migration() or rollback_migration().'''
+    if WriteAheadLog(os.path.join(path, WAL_NAME)).pending():
+        error("%s holds an interrupted save, open it with braindump first" % (path))
+        return None
+    # the backup directories are made up front, the workers would race
+    backup = os.path.join(path, MIGRATE_BACKUP)
+    if not os.path.isdir(backup):
+        os.mkdir(backup)
+    names = _scan_dir((path, None))[0].keys()
+    for subdir in _shard_dirs(path):
+        names.extend(_scan_dir((path, subdir))[0].keys())
+        if not os.path.isdir(os.path.join(backup, subdir)):
+            os.mkdir(os.path.join(backup, subdir))
+    chunks = [(path, names[i:i+_LOAD_CHUNK], dates)
+              for i in range(0, len(names), _LOAD_CHUNK)]
+    pool = None
+    if multiprocessing is None or jobs == 1 or len(chunks) < 2:
+        results = (_migrate_files(chunk) for chunk in chunks)
+    else:
+        if jobs == 0:
+            jobs = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(jobs)
+        results = pool.imap_unordered(_migrate_files, chunks)
+    migrated = failed = done = 0
+    # rollback_migration() checks the files against these, appended as each
+    # chunk is done so an interrupted run keeps them too
+    fd = open(os.path.join(backup, _MIGRATE_DIGESTS), "ab")
+    try:
+        for n, m, digests, f in results:
+            done = done + n
+            migrated = migrated + m
+            failed = failed + f
+            if digests:
+                pickle.dump(digests, fd, pickle.HIGHEST_PROTOCOL)
+                fd.flush()
+                os.fsync(fd.fileno())
+            if progress:
+                progress(done, len(names))
+    finally:
+        fd.close()
+        if pool:
+            pool.close()
+            pool.join()
+    info("migrated %d of %d files in %s" % (migrated, len(names), path))
+    return (migrated, failed)
+
+def _migrated_digests(backup):
+    '''Return a dict of name -> digest of the files written by migrate_format().'''
+    digests = {}
+    filename = os.path.join(backup, _MIGRATE_DIGESTS)
+    if not os.path.exists(filename):
+        return digests
+    fd = open(filename, "rb")
+    try:
+        while True:
+            try:
+                digests.update(pickle.load(fd))
+            except EOFError:
+                break
+    finally:
+        fd.close()
+    return digests
+
+def rollback_migration(path, force=False):
+    '''Put back the files replaced by migrate_format(), return how many.
+    Returns None if any changed since, unless force, which keeps them as
+    name.migrated.'''
+    backup = os.path.join(path, MIGRATE_BACKUP)
+    if not os.path.isdir(backup):
+        return 0
+    names = []
+    for subdir in [""] + _shard_dirs(backup):
+        names.extend([os.path.join(subdir, name)
+                      for name in os.listdir(os.path.join(backup, subdir))
+                      if fnmatch.fnmatch(name, "*.xml")])
+    digests = _migrated_digests(backup)
+    changed = []
+    for name in names:
+        filename = os.path.join(path, name)
+        data = None
+        if os.path.exists(filename):
+            fd = open(filename, "rb")
+            try:
+                data = fd.read()
+            finally:
+                fd.close()
+        if data is None or content_digest(data) != digests.get(name, None):
+            changed.append(name)
+    if changed and not force:
+        error("%d files in %s changed since the migration, not rolling back: %s" %
+              (len(changed), path, ", ".join(changed[:5])))
+        return None
+
+    for name in changed:
+        filename = os.path.join(path, name)
+        if os.path.exists(filename):
+            warning("keeping the changed %s as %s.migrated" % (filename, filename))
+            os.rename(filename, filename + ".migrated")
+    for name in names:
+        os.rename(os.path.join(backup, name), os.path.join(path, name))
+    for subdir in _shard_dirs(backup):
+        os.rmdir(os.path.join(backup, subdir))
+    if os.path.exists(os.path.join(backup, _MIGRATE_DIGESTS)):
+        os.unlink(os.path.join(backup, _MIGRATE_DIGESTS))
+    os.rmdir(backup)
+    info("restored %d files in %s" % (len(names), path))
+    return len(names)
+
+def finish_migration(path):
+    '''Drop the originals kept by migrate_format(), it can no longer be rolled
+    back.'''
+    shutil.rmtree(os.path.join(path, MIGRATE_BACKUP), True)
@@ -0,0 +1,192 @@
+#    Filename: xmlwriter.py
+#      Author: Darren Hart <darren@dvhart.com>
+# Description: serialize gtd objects to the xml files read by xmlstore
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Copyright (C) Darren Hart, 2009
+#
+# 2009-Jun-20:  Initial version by Darren Hart <darren@dvhart.com>
+
+import re
+import calendar
+from xml.sax.saxutils import escape, quoteattr
+import gtd
+from logging import debug, info, warning, error, critical
+
+# The format version, written as a version attribute of the root element.
+# Files without one are version 1, which also repeated the title of every
+# referenced object in its *_ref element.  Version 2 references objects by
+# id only, so renaming an object no longer leaves stale titles behind, and a
+# file can be written from its record (see records.py) alone.
+FORMAT_VERSION = 2
+
+# The documents are laid out as saxutils.XMLGenerator used to write them
+# (with its default iso-8859-1 encoding): a header, the root element with
+# its attributes on a line of its own, then one child element per line.
+# Empty elements are written out in full (<due_date></due_date>).
+# Characters outside of latin-1 become character references.
+ENCODING = "iso-8859-1"
+
+# Date formats.  Text dates are "%Y-%m-%d %H:%M:%S", epoch dates are whole
+# seconds since 1970-01-01 00:00:00 (the naive datetime taken as UTC, so they
+# round trip exactly whatever the local timezone).  Both are always read.
+DATES_TEXT = "text"
+DATES_EPOCH = "epoch"
+
+_HEADER = '<?xml version="1.0" encoding="%s"?>\n' % (ENCODING)
+_ROOT = '<%s id=%s version="' + str(FORMAT_VERSION) + '">'
+
+# Only fields holding one of these characters are passed through escape()
+_TEXT_SPECIAL = re.compile(r'[&<>]')
+_ATTR_SPECIAL = re.compile(r'[&<>"\n\r\t]')
+
+_SIMPLE = _HEADER + _ROOT + '%s</%s>\n'
+
+_TASK_HEAD = _HEADER + _ROOT + ('\n'
+                                 '<title>%s</title>\n'
+                                 '<notes>%s</notes>\n'
+                                 '<start_date>%s</start_date>\n'
+                                 '<due_date>%s</due_date>\n')
+_TASK_TAIL = '<complete>%s</complete>\n</task>'
+
+_PROJECT = _HEADER + _ROOT + ('\n'
+                              '<title>%s</title>\n'
+                              '<notes>%s</notes>\n'
+                              '<start_date>%s</start_date>\n'
+                              '<due_date>%s</due_date>\n'
+                              '%s'
+                              '<complete>%s</complete>\n'
+                              '</project>')
+
+_AREA = _HEADER + _ROOT + ('\n'
+                           '<title>%s</title>\n'
+                           '%s'
+                           '</area>')
+
+_REF = '<%s id=%s></%s>\n'
+
+def _text(s):
+    if not s:
+        return ""
+    if _TEXT_SPECIAL.search(s):
+        s = escape(s)
+    if isinstance(s, unicode):
+        s = s.encode(ENCODING, "xmlcharrefreplace")
+    return s
+
+def _attr(value):
+    s = str(value)
+    if _ATTR_SPECIAL.search(s):
+        return quoteattr(s)
+    return '"' + s + '"'
+
+def _ref(name, id):
+    if id is None:
+        return ""
+    return _REF % (name, _attr(id), name)
+
+def _date(d):
+    '''Format d as _DATE_FORMAT in xmlstore does, without strftime.'''
+    if not d:
+        return ""
+    return "%04d-%02d-%02d %02d:%02d:%02d" % (d.year, d.month, d.day,
+                                              d.hour, d.minute, d.second)
+
+def _epoch(d):
+    if not d:
+        return ""
+    return "%d" % (calendar.timegm(d.timetuple()))
+
+_DATE_WRITERS = {DATES_TEXT:_date, DATES_EPOCH:_epoch}
+
+# The documents, given the fields of a record and the date writer
+
+def _simple_xml(type, id, title):
+    return _SIMPLE % (type, _attr(id), _text(title), type)
+
+def _area_xml(id, title, realm):
+    return _AREA % ("area", _attr(id), _text(title), _ref("realm_ref", realm))
+
+def _project_xml(id, title, notes, start_date, due_date, area, complete, date):
+    return _PROJECT % ("project", _attr(id), _text(title), _text(notes),
+                       date(start_date), date(due_date), _ref("area_ref", area),
+                       date(complete))
+
+def _task_xml(id, title, notes, start_date, due_date, project, contexts, complete,
+              date):
+    parts = [_TASK_HEAD % ("task", _attr(id), _text(title), _text(notes),
+                           date(start_date), date(due_date)),
+             _ref("project_ref", project)]
+    for c in contexts:
+        parts.append(_REF % ("context_ref", _attr(c), "context_ref"))
+    parts.append(_TASK_TAIL % (date(complete)))
+    return "".join(parts)
+
+def _id(obj):
+    '''Return the id of obj, None for the None path objects.'''
+    if isinstance(obj, gtd.BaseNone):
+        return None
+    return obj.id
+
+def context_xml(context, dates=DATES_TEXT):
+    return _simple_xml("context", context.id, context.title)
+
+def realm_xml(realm, dates=DATES_TEXT):
+    return _simple_xml("realm", realm.id, realm.title)
+
+def area_xml(area, dates=DATES_TEXT):
+    return _area_xml(area.id, area.title, _id(area.realm))
+
+def project_xml(project, dates=DATES_TEXT):
+    return _project_xml(project.id, project.title, project.notes, project.start_date,
+                        project.due_date, _id(project.area), project.complete,
+                        _DATE_WRITERS[dates])
+
+def task_xml(task, dates=DATES_TEXT):
+    contexts = []
+    for c in task.contexts:
+        if isinstance(c, gtd.ContextNone):
+            error("ContextNone should not be stored in the task!")
+            continue
+        contexts.append(c.id)
+    return _task_xml(task.id, task.title, task.notes, task.start_date, task.due_date,
+                     _id(task.project), contexts, task.complete,
+                     _DATE_WRITERS[dates])
+
+_SERIALIZERS = {"context":context_xml, "realm":realm_xml, "area":area_xml,
+                "project":project_xml, "task":task_xml}
+
+def object_xml(obj, dates=DATES_TEXT):
+    '''Return the xml document (a latin-1 encoded str) describing obj, with
+    dates in the DATES_* format dates.'''
+    return _SERIALIZERS[obj.__class__.__name__.lower()](obj, dates)
+
+def record_xml(rec, dates=DATES_TEXT):
+    '''Return the xml document describing the record rec (see records.py), the
+    same document object_xml() returns for the object.  The notes must have
+    been loaded.'''
+    type = rec["type"]
+    date = _DATE_WRITERS[dates]
+    if type in ["context", "realm"]:
+        return _simple_xml(type, rec["id"], rec["title"])
+    elif type == "area":
+        return _area_xml(rec["id"], rec["title"], rec["realm"])
+    elif type == "project":
+        return _project_xml(rec["id"], rec["title"], rec["notes"], rec["start_date"],
+                            rec["due_date"], rec["area"], rec["complete"], date)
+    return _task_xml(rec["id"], rec["title"], rec["notes"], rec["start_date"],
+                     rec["due_date"], rec["project"], rec["contexts"], rec["complete"],
+                     date)